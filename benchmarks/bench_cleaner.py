@@ -0,0 +1,121 @@
+"""
+整理步骤的微基准：预编译、合并扫描后的实现与原实现的单本书用时对比
+
+用法（在项目根目录）：python -m benchmarks.bench_cleaner [字符数]
+"""
+import os
+import re
+import sys
+import copy
+import time
+import tempfile
+
+from benchmarks.synthetic import make_cjk_book, make_toc
+from src.clear_pdf_book_txt_to_md import (
+    clean_title, mark_style, mark_footnotes_from_list, parse_toc,
+    mark_titles, join_lines, run_clean_pipeline,
+)
+
+STYLE_REPLACE_PATTERN = {"zhuzm": "[^$1]", "zhutm": "\n\n[^$1]: ", "daodu": "【$1】"}
+STYLES = {"19": "zhuzm", "20": "zhuzm", "24": "daodu", "25": "zhutm"}
+
+# ---------------------------------------------------------------------------
+# 原实现：每次调用都以字符串模式调用re，标题逐项逐行清理
+# ---------------------------------------------------------------------------
+
+def legacy_clean_title(title: str):
+    return re.sub(r'[\s\da-zA-Z\[\]\{\}\.\^]', '', title.strip())
+
+def legacy_mark_titles(text: list[str], toc_items: list[dict]):
+    marked_lines = copy.deepcopy(text)
+    not_found = []
+    for item in toc_items:
+        found = False
+        for i, line in enumerate(text):
+            if item['name'] == legacy_clean_title(line.strip()):
+                marked_lines[i] = f"{'#' * item['level']} {line.strip()}"
+                found = True
+        if not found:
+            not_found.append(item)
+    return marked_lines, not_found
+
+def legacy_join_lines(text: str) -> str:
+    lines = text.split('\n')
+    result_lines = []
+    i = 0
+    while i < len(lines):
+        current_line = lines[i]
+        if len(current_line) >= 30 and re.match(r'[一-鿿]', current_line[-1]):
+            j = i + 1
+            while j < len(lines) and not lines[j].strip():
+                j += 1
+            if j < len(lines) and lines[j].strip() and re.match(r'[一-鿿]', lines[j][0]):
+                result_lines.append(current_line + lines[j])
+                i = j + 1
+                continue
+        result_lines.append(current_line)
+        i += 1
+    return '\n'.join(result_lines)
+
+def legacy_clean_book(text: str, toc: str) -> str:
+    """原__main__中的整理流程"""
+    text = re.sub(r'!\[image\](.+?)\{.+?\}', r'  ', text)
+    code_replace_pattern_map = {int(k): STYLE_REPLACE_PATTERN[v] for k, v in STYLES.items()}
+    text, _ = mark_style(text, code_replace_pattern_map, default_replace_pattern="$1")
+    lines = mark_footnotes_from_list(text.split('\n'))
+    lines = [line.lstrip() for line in lines]
+    text = re.sub(r'\n\s*\n', '\n\n', "\n".join(lines))
+    text = re.sub('\n\n\n+', '\n\n\n', text)
+    text = re.sub(r'\n前\n\n言\n', r'\n前言\n', text)
+    text = re.sub(r'\n目\n\n录\n', r'\n目录\n', text)
+    lines, _ = legacy_mark_titles(text.split('\n'), parse_toc(toc))
+    return re.sub(r'(.{30,}[一-鿿])\n{1,2}([一-鿿])', r'\1\2', "\n".join(lines), flags=re.MULTILINE)
+
+# ---------------------------------------------------------------------------
+
+def best_of(func, *args, repeat: int=3) -> float:
+    """多次运行取最短用时"""
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+def report(name: str, legacy: float, current: float) -> None:
+    print(f"{name:<24}{legacy*1000:>10.1f}ms{current*1000:>10.1f}ms{legacy/current:>8.1f}x")
+
+def main(size: int=1_000_000) -> None:
+    text, titles = make_cjk_book(size, raw=True)
+    toc = make_toc(titles)
+    lines = text.split('\n')
+    toc_items = parse_toc(toc)
+    print(f"合成书稿：{len(text)}字符，{len(lines)}行，{len(toc_items)}个目录项\n")
+    print(f"{'函数':<22}{'原实现':>10}{'现实现':>10}{'加速':>8}\n{'-'*54}")
+
+    report("clean_title(每行)",
+           best_of(lambda: [legacy_clean_title(line) for line in lines]),
+           best_of(lambda: [clean_title(line) for line in lines]))
+    report("mark_titles",
+           best_of(legacy_mark_titles, lines, toc_items, repeat=1),
+           best_of(mark_titles, lines, toc_items))
+    report("join_lines",
+           best_of(legacy_join_lines, text),
+           best_of(join_lines, text))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        toc_path = os.path.join(tmp, 'toc.md')
+        with open(toc_path, 'w', encoding='utf-8') as f:
+            f.write(toc)
+        ctx = {'styles': STYLES, 'style_replace_pattern': STYLE_REPLACE_PATTERN,
+               'default_replace_pattern': '$1', 'toc': toc_path}
+        legacy_text = legacy_clean_book(text, toc)
+        current_text, _ = run_clean_pipeline(text, dict(ctx))
+        assert legacy_text == current_text, "流水线结果与原流程不一致"
+        report("整本书",
+               best_of(legacy_clean_book, text, toc, repeat=1),
+               best_of(lambda: run_clean_pipeline(text, dict(ctx))))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,137 @@
+"""
+校对引擎的基准测试：用本地模拟服务重放切分好的JSON
+
+对每个并发设置运行一遍process_paragraphs_async，报告总用时、吞吐量和延迟分位数，
+便于离线比较调度、限速、持久化等改动。
+
+用法（在项目根目录）：
+    python -m benchmarks.bench_engine [--json example/your_markdown.json] [--concurrency 1,3,8]
+        [--median 1.0] [--error-rate 0.0] [--rate-limit-rate 0.0] [--repeat 1] [--mode full] [--hedge-budget 0.0]
+        [--coalesce]
+
+重复多遍的片段内容相同，默认关闭合并重复片段（coalesce），每个片段都发出请求；
+加--coalesce时开启，用于测试合并的效果
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+from benchmarks.mock_llm_server import MockSettings, start_server
+from src import proofreader
+from src.telemetry import percentile
+
+MOCK_MODEL = "deepseek-mock"
+
+
+def register_mock_model(port: int) -> None:
+    """
+    把模拟服务登记为一个OpenAI兼容模型
+    """
+    os.environ.setdefault("MOCK_API_KEY", "mock")
+    proofreader.OPENAI_COMPATIBLE_MODELS[MOCK_MODEL] = ("MOCK_API_KEY", f"http://127.0.0.1:{port}")
+
+
+def load_segments(json_in: str, repeat: int=1) -> list[dict]:
+    """
+    读取切分好的JSON，可重复多遍以放大规模
+    """
+    with open(json_in, "r", encoding="utf-8") as f:
+        segments = json.load(f)
+    return segments * repeat
+
+
+def run_once(segments: list[dict], concurrency: int, rpm: int, workdir: str, **engine_options) -> dict:
+    """
+    在workdir中以给定并发数跑一遍，返回统计；默认不合并重复片段（engine_options中可传coalesce=True）
+    """
+    engine_options.setdefault("coalesce", False)
+    json_in = os.path.join(workdir, "in.json")
+    json_out = os.path.join(workdir, f"out.c{concurrency}.json")
+    with open(json_in, "w", encoding="utf-8") as f:
+        json.dump(segments, f, ensure_ascii=False)
+
+    start_time = time.perf_counter()
+    # 引擎逐段打印进度，基准测试时不需要
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(proofreader.process_paragraphs_async(
+            json_in, json_out, model=MOCK_MODEL, rpm=rpm, max_concurrent=concurrency, **engine_options))
+    wall_time = time.perf_counter() - start_time
+
+    records = []
+    with open(f"{json_out}.requests.jsonl", "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    ok = [r for r in records if r.get("status") == "ok"]
+    latencies = [r["latency"] for r in ok if r.get("latency") is not None]
+    # 完成数按输出JSON计（合并重复片段时，一个请求完成多个片段）
+    with open(json_out, "r", encoding="utf-8") as f:
+        done = sum(1 for p in json.load(f) if p is not None)
+    return {
+        "concurrency": concurrency,
+        "segments": len(segments),
+        "ok": done,
+        "requests": len(records),
+        "wall_time": wall_time,
+        "throughput": done / wall_time if wall_time else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "retries": sum(r.get("retries") or 0 for r in records),
+    }
+
+
+def format_row(r: dict) -> str:
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}"
+    return (f"{r['concurrency']:>4}\t{r['ok']}/{r['segments']}\t{r['requests']}\t{r['wall_time']:.2f}s\t"
+            f"{r['throughput']:.2f}/s\t{seconds(r['p50'])}\t{seconds(r['p95'])}\t{seconds(r['p99'])}\t{r['retries']}")
+
+
+def main(argv: list[str]|None=None) -> list[dict]:
+    parser = argparse.ArgumentParser(description="用本地模拟服务测试校对引擎")
+    parser.add_argument("--json", default="example/your_markdown.json", help="切分好的JSON")
+    parser.add_argument("--repeat", type=int, default=1, help="把片段重复多遍以放大规模")
+    parser.add_argument("--concurrency", default="1,3,8", help="并发数列表，逗号分隔")
+    parser.add_argument("--rpm", type=int, default=6000, help="限速（每分钟请求数）")
+    parser.add_argument("--median", type=float, default=1.0, help="首token延迟中位数（秒）")
+    parser.add_argument("--sigma", type=float, default=0.5, help="延迟对数正态分布的形状参数")
+    parser.add_argument("--per-token", type=float, default=0.005, help="每个输出token的时间（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", default="full", choices=["full", "edits"], help="模型输出全文或修改清单")
+    parser.add_argument("--hedge-budget", type=float, default=0.0, help="对冲请求数占请求数的比例上限，0为不对冲")
+    parser.add_argument("--coalesce", action="store_true", help="合并重复片段（--repeat的各遍只请求一次）")
+    args = parser.parse_args(argv)
+
+    segments = load_segments(args.json, args.repeat)
+    results = []
+    print(f"{args.json} × {args.repeat}：{len(segments)}个片段")
+    print(f"并发\t完成\t请求数\t总用时\t吞吐量\tp50\tp95\tp99\t重试\n{'-'*72}")
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        settings = MockSettings(args.median, args.sigma, args.per_token,
+                                args.error_rate, args.rate_limit_rate, seed=args.seed)
+        server = start_server(settings)
+        register_mock_model(server.server_address[1])
+        workdir = tempfile.mkdtemp(prefix="bench_engine_")
+        try:
+            result = run_once(segments, concurrency, args.rpm, workdir, mode=args.mode, hedge_budget=args.hedge_budget,
+                              coalesce=args.coalesce)
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(workdir, ignore_errors=True)
+            # 客户端按接口地址缓存，端口变了需要重建
+            proofreader.get_openai_client.cache_clear()
+        results.append(result)
+        print(format_row(result))
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
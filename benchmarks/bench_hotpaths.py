@@ -0,0 +1,158 @@
+"""
+切分、匹配、整理、比较等CPU密集函数的微基准
+
+用合成中文书稿在不同规模（默认100KB、1MB、10MB，按UTF-8字节计）下运行各函数，
+记录用时和内存峰值（tracemalloc），并按相邻规模估算增长阶数，超线性增长时标出。
+
+匹配（find_best_match）和difflib比较处理的是片段而非整本书，其输入按scale缩小。
+
+用法（在项目根目录）：
+    python -m benchmarks.bench_hotpaths [--sizes 100K,1M,10M] [--only 名称片段] [--no-memory]
+"""
+import sys
+import math
+import time
+import argparse
+import tracemalloc
+
+from benchmarks.synthetic import make_cjk_book, make_toc
+from src.splitter import (
+    cut_text_by_length,
+    split_markdown_by_title,
+    split_markdown_by_title_and_length_with_context,
+    split_markdown_by_title_and_length_and_merge,
+)
+from src.clear_pdf_book_txt_to_md import (
+    parse_toc, mark_titles, mark_footnotes_from_abc, delete_wrong_split, join_lines, run_clean_pipeline,
+)
+from src.match_similar_text import find_best_match
+from src.diff_tools import diff_md_text, split_md_text
+
+# 增长阶数超过此值视为超线性
+SUPERLINEAR_EXPONENT = 1.3
+
+
+def parse_size(text: str) -> int:
+    """
+    解析"100K"、"1M"等规模（字节）
+    """
+    text = text.strip().upper()
+    units = {"K": 1_000, "M": 1_000_000}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def make_inputs(size_bytes: int) -> dict:
+    """
+    生成某个规模的各类输入；中文在UTF-8中约3字节一个字
+    """
+    chars = max(1000, size_bytes // 3)
+    book, titles = make_cjk_book(chars)
+    raw_book, raw_titles = make_cjk_book(chars, raw=True)
+    middle = len(book) // 2
+    query = book[middle:middle + 20]
+    return {
+        "chars": chars,
+        "book": book,
+        "raw_book": raw_book,
+        "raw_lines": raw_book.split("\n"),
+        "toc_items": parse_toc(make_toc(raw_titles)),
+        "proofread": book.replace("的", "地", 50),
+        # 匹配用的原文片段：原样的（走精确匹配），删一个字、改一个字的（走模糊匹配）
+        "query": query,
+        "fuzzy_query": query[:5] + query[6:12] + "错" + query[13:],
+    }
+
+
+# 名称 → (函数, 输入规模缩小倍数)；函数接收make_inputs的结果
+CASES = {
+    "splitter.cut_text_by_length": (lambda d: cut_text_by_length(d["book"], cut_by=600), 1),
+    "splitter.split_markdown_by_title": (lambda d: split_markdown_by_title(d["book"], levels=[1, 2]), 1),
+    "splitter.with_context": (lambda d: split_markdown_by_title_and_length_with_context(d["book"], levels=[1, 2], cut_by=600), 1),
+    "splitter.and_merge": (lambda d: split_markdown_by_title_and_length_and_merge(d["book"], levels=[2]), 1),
+    "cleaner.run_clean_pipeline": (lambda d: run_clean_pipeline(d["raw_book"], {"default_replace_pattern": "$1"}), 1),
+    "cleaner.mark_titles": (lambda d: mark_titles(d["raw_lines"], d["toc_items"]), 1),
+    "cleaner.mark_footnotes_from_abc": (lambda d: mark_footnotes_from_abc(list(d["raw_lines"])), 1),
+    "cleaner.delete_wrong_split": (lambda d: delete_wrong_split(d["raw_book"]), 1),
+    "cleaner.join_lines": (lambda d: join_lines(d["raw_book"]), 1),
+    "matcher.find_best_match": (lambda d: find_best_match(d["book"], d["query"]), 100),
+    "matcher.find_best_match.fuzzy": (lambda d: find_best_match(d["book"], d["fuzzy_query"]), 100),
+    "diff.split_md_text": (lambda d: split_md_text(d["book"], d["proofread"], levels=[1]), 1),
+    "diff.diff_md_text": (lambda d: diff_md_text(d["book"].splitlines(), d["proofread"].splitlines()), 100),
+}
+
+
+def measure(func, data: dict, memory: bool=True) -> tuple[float, int|None]:
+    """
+    运行一次，返回(用时秒, 内存峰值字节)；内存在单独一次运行中测量，不影响计时
+    """
+    start_time = time.perf_counter()
+    func(data)
+    elapsed = time.perf_counter() - start_time
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def growth_exponent(n1: int, t1: float, n2: int, t2: float) -> float|None:
+    """
+    按两点估算增长阶数：t ∝ n^k
+    """
+    if t1 <= 0 or t2 <= 0 or n1 == n2:
+        return None
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def main(argv: list[str]|None=None) -> dict:
+    parser = argparse.ArgumentParser(description="CPU密集函数的微基准")
+    parser.add_argument("--sizes", default="100K,1M,10M", help="规模列表（UTF-8字节），逗号分隔")
+    parser.add_argument("--only", default="", help="只运行名称中含有此文本的用例")
+    parser.add_argument("--no-memory", action="store_true", help="不测量内存峰值")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    cases = {name: case for name, case in CASES.items() if args.only in name}
+    inputs_cache: dict[int, dict] = {}
+    results: dict[str, list[tuple[int, float, int|None]]] = {name: [] for name in cases}
+
+    print(f"{'用例':<34}{'规模':>8}{'字数':>10}{'用时':>10}{'内存峰值':>12}{'阶数':>8}")
+    print("-" * 84)
+    for name, (func, scale) in cases.items():
+        for size in sizes:
+            scaled = max(1000, size // scale)
+            if scaled not in inputs_cache:
+                inputs_cache[scaled] = make_inputs(scaled)
+            data = inputs_cache[scaled]
+            elapsed, peak = measure(func, data, memory=not args.no_memory)
+            exponent = None
+            if results[name]:
+                n1, t1, _ = results[name][-1]
+                exponent = growth_exponent(n1, t1, data["chars"], elapsed)
+            results[name].append((data["chars"], elapsed, peak))
+            flag = " !" if exponent is not None and exponent > SUPERLINEAR_EXPONENT else ""
+            print(f"{name:<34}{scaled:>8}{data['chars']:>10}{elapsed*1000:>8.1f}ms"
+                  f"{'-' if peak is None else f'{peak/1e6:.1f}MB':>12}"
+                  f"{'-' if exponent is None else f'{exponent:.2f}':>8}{flag}")
+
+    superlinear = []
+    for name, points in results.items():
+        if len(points) >= 2:
+            exponent = growth_exponent(points[0][0], points[0][1], points[-1][0], points[-1][1])
+            if exponent is not None and exponent > SUPERLINEAR_EXPONENT:
+                superlinear.append((name, exponent))
+    print("\n增长报告：")
+    if superlinear:
+        for name, exponent in superlinear:
+            print(f"! {name}: 用时约按 n^{exponent:.2f} 增长（超线性）")
+    else:
+        print("所有用例均接近线性增长")
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+"""
+导入校对模块的启动用时预算检查
+
+用`python -X importtime`在子进程中导入src.proofreader，
+超出预算或导入了各家SDK（应在首次调用时才导入）时以非零状态退出，可用于CI。
+
+用法（在项目根目录）：python -m benchmarks.bench_import [预算毫秒数]
+"""
+import sys
+import subprocess
+
+MODULE = "src.proofreader"
+# 只应在首次调用时导入的重型模块
+LAZY_MODULES = ("openai", "google", "dotenv", "httpx")
+DEFAULT_BUDGET_MS = 100
+
+
+def measure_import(module: str=MODULE) -> tuple[float, list[str]]:
+    """
+    在新进程中导入module
+
+    Returns:
+        tuple: (module的累计导入用时（毫秒）, 导入的全部模块名)
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    cumulative_us = 0
+    imported = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        imported.append(name)
+        if name == module:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, imported
+
+
+def main(budget_ms: float=DEFAULT_BUDGET_MS) -> int:
+    # 取多次中的最小值，减少磁盘缓存等的干扰
+    runs = [measure_import() for _ in range(5)]
+    elapsed_ms = min(ms for ms, _ in runs)
+    imported = runs[0][1]
+    eager = sorted({name for name in imported if name.split(".")[0] in LAZY_MODULES})
+
+    print(f"import {MODULE}: {elapsed_ms:.1f}ms（预算 {budget_ms:.0f}ms）")
+    ok = True
+    if elapsed_ms > budget_ms:
+        print("超出启动用时预算")
+        ok = False
+    if eager:
+        print(f"不应在导入时加载: {', '.join(eager)}")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS))
@@ -0,0 +1,195 @@
+"""
+本地的OpenAI兼容模拟服务，用于离线测试校对引擎的速度
+
+POST /chat/completions（或/v1/chat/completions）：原样返回最后一条用户消息，
+要求JSON输出（response_format为json_object，即修改清单模式）时返回空的修改清单；
+按配置模拟延迟、服务端错误和429限流，支持流式（SSE）与非流式应答。
+
+用法（在项目根目录）：python -m benchmarks.mock_llm_server [--port 8765] [--median 2.0] [--error-rate 0.02] [--rate-limit-rate 0.05]
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.splitter import estimate_tokens
+
+
+class MockSettings:
+    """
+    模拟参数
+
+    latency: 首个token前的延迟，对数正态分布（中位数median秒，形状sigma）
+    per_token: 每个输出token的生成时间（秒）
+    error_rate: 返回500的概率
+    rate_limit_rate: 返回429的概率
+    max_tokens: 输出token上限，超过时截断，finish_reason为length（模拟超长片段）
+    key_errors: API key → 对该key始终返回的状态码（如401、429），模拟失效或超额的key
+    edit_rate: 在返回的全文中做一处修改（“的”改为“地”）的概率，模拟模型提出了修改
+    """
+    def __init__(self, median: float=2.0, sigma: float=0.5, per_token: float=0.01,
+                 error_rate: float=0.0, rate_limit_rate: float=0.0, seed: int|None=None, max_tokens: int|None=None,
+                 key_errors: dict[str, int]|None=None, edit_rate: float=0.0):
+        self.median = median
+        self.sigma = sigma
+        self.per_token = per_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_tokens = max_tokens
+        self.key_errors = key_errors or {}
+        self.edit_rate = edit_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0, "keys": {}}
+
+    def draw(self) -> tuple[str, float]:
+        """
+        抽取本次请求的结果（ok/error/rate_limited）和首token延迟
+        """
+        with self.lock:
+            self.counts["requests"] += 1
+            r = self.rng.random()
+            latency = self.rng.lognormvariate(0, self.sigma) * self.median
+            if r < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return "rate_limited", 0.0
+            if r < self.rate_limit_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return "error", latency
+            return "ok", latency
+
+
+def make_handler(settings: MockSettings):
+    """
+    生成绑定了模拟参数的请求处理类
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            api_key = self.headers.get("Authorization", "").removeprefix("Bearer ")
+            with settings.lock:
+                settings.counts["keys"][api_key] = settings.counts["keys"].get(api_key, 0) + 1
+            if api_key in settings.key_errors:
+                status = settings.key_errors[api_key]
+                self.send_json(status, {"error": {"message": f"mock key error {status}", "type": "key_error"}})
+                return
+            outcome, latency = settings.draw()
+            if outcome == "rate_limited":
+                self.send_json(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}}, {"Retry-After": "1"})
+                return
+            time.sleep(latency)
+            if outcome == "error":
+                self.send_json(500, {"error": {"message": "mock server error", "type": "server_error"}})
+                return
+
+            messages = body.get("messages", [])
+            content = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+            if (body.get("response_format") or {}).get("type") == "json_object":
+                content = '{"edits": []}'
+            elif settings.edit_rate:
+                with settings.lock:
+                    edit = settings.rng.random() < settings.edit_rate
+                if edit:
+                    content = content.replace("的", "地", 1) if "的" in content else content.replace("\n</target>", "。\n</target>")
+            prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+            completion_tokens = estimate_tokens(content)
+            finish_reason = "stop"
+            if settings.max_tokens and completion_tokens > settings.max_tokens:
+                content = content[:len(content) * settings.max_tokens // completion_tokens]
+                completion_tokens = settings.max_tokens
+                finish_reason = "length"
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens, "prompt_cache_hit_tokens": 0}
+            model = body.get("model", "mock")
+
+            if body.get("stream"):
+                self.stream(content, model, usage, completion_tokens, finish_reason)
+            else:
+                time.sleep(settings.per_token * completion_tokens)
+                self.send_json(200, {
+                    "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": finish_reason,
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": usage,
+                })
+
+        def stream(self, content: str, model: str, usage: dict, completion_tokens: int, finish_reason: str="stop"):
+            """按块发送SSE，模拟逐token生成"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            chunk_size = 20
+            pieces = [content[k:k+chunk_size] for k in range(0, len(content), chunk_size)] or [""]
+            delay = settings.per_token * completion_tokens / len(pieces)
+            base = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+            self.close_connection = True
+            try:
+                for k, piece in enumerate(pieces):
+                    finish = finish_reason if k == len(pieces) - 1 else None
+                    self.send_event({**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": finish}]})
+                    time.sleep(delay)
+                self.send_event({**base, "choices": [], "usage": usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端中途断开（如对冲请求中落后的一方被取消）
+                pass
+
+        def send_event(self, obj: dict):
+            self.wfile.write(f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def send_json(self, status: int, obj: dict, headers: dict|None=None):
+            data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(settings: MockSettings, port: int=0, host: str="127.0.0.1") -> ThreadingHTTPServer:
+    """
+    在后台线程启动模拟服务；port为0时自动选择空闲端口（见server.server_address）
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI兼容的模拟校对服务")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--median", type=float, default=2.0, help="首token延迟中位数（秒）")
+    parser.add_argument("--sigma", type=float, default=0.5, help="延迟对数正态分布的形状参数")
+    parser.add_argument("--per-token", type=float, default=0.01, help="每个输出token的时间（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-tokens", type=int, default=None, help="输出token上限，超过时截断")
+    args = parser.parse_args()
+
+    mock_settings = MockSettings(args.median, args.sigma, args.per_token, args.error_rate, args.rate_limit_rate,
+                                 max_tokens=args.max_tokens)
+    mock_server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(mock_settings))
+    print(f"模拟服务: http://127.0.0.1:{args.port}")
+    try:
+        mock_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
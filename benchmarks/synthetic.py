@@ -0,0 +1,86 @@
+"""
+生成用于基准测试的合成中文书稿
+
+书稿结构与整理前的pandoc输出相近：目录、标题、正文段落、数字列表注释、
+样式文本`[text]{.s19}`、图像链接、被错误拆开的长句、abc脚注（文中标记和段后的脚注行）等。
+"""
+import random
+
+# 常用汉字，避免生僻字影响分词、匹配等逻辑
+COMMON_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处理"
+)
+PUNCTUATION = "，，，。。！？；："
+
+def make_sentence(rng: random.Random, min_length: int=8, max_length: int=40) -> str:
+    """生成一个以句末标点结尾的句子"""
+    length = rng.randint(min_length, max_length)
+    chars = [rng.choice(COMMON_CHARS) for _ in range(length)]
+    for k in range(6, length - 1, rng.randint(6, 12)):
+        chars[k] = "，"
+    return "".join(chars) + rng.choice("。。。！？；")
+
+def make_paragraph(rng: random.Random, sentences: int|None=None) -> str:
+    """生成一个段落"""
+    count = sentences if sentences is not None else rng.randint(1, 6)
+    return "".join(make_sentence(rng) for _ in range(count))
+
+def make_cjk_book(size: int, seed: int=0, chapters_per_100k: int=20, raw: bool=False) -> tuple[str, list[str]]:
+    """
+    生成约size个字符的markdown书稿
+
+    Args:
+        size: 目标字符数
+        seed: 随机种子，保证可复现
+        chapters_per_100k: 每十万字的章数
+        raw: 为True时模拟未整理的pandoc输出（无标题标记，含样式、图像、列表注释、abc脚注和错误分段）
+
+    Returns:
+        tuple: (书稿文本, 章节标题列表)
+    """
+    rng = random.Random(seed)
+    # 脚注另用一个随机数序列，不改变其余内容
+    note_rng = random.Random(seed + 1)
+    chapter_count = max(1, size * chapters_per_100k // 100_000)
+    chapter_size = size // chapter_count
+    lines = []
+    titles = []
+    for c in range(chapter_count):
+        title = f"第{c+1}章 {''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(2, 6)))}"
+        titles.append(title)
+        lines.extend([f"  {title}" if raw else f"# {title}", ""])
+        written = 0
+        section = 0
+        while written < chapter_size:
+            if not raw and written > (section + 1) * chapter_size // 4:
+                section += 1
+                lines.extend([f"## 第{section}节", ""])
+            paragraph = make_paragraph(rng)
+            if raw:
+                r = rng.random()
+                if r < 0.05:
+                    paragraph = f"![image](media/{c}.png){{width=\"3in\"}}{paragraph}"
+                elif r < 0.15:
+                    paragraph = f"[{make_sentence(rng, 2, 6)}]{{.s{rng.choice([19, 20, 24, 25])}}}{paragraph}"
+                elif r < 0.25:
+                    paragraph = f"{rng.randint(1, 9)}. {paragraph}"
+                elif r < 0.35 and len(paragraph) > 40:
+                    # 错误分段：长句中间断开
+                    cut = len(paragraph) // 2
+                    paragraph = f"{paragraph[:cut]}\n\n{paragraph[cut:]}"
+            footnotes = []
+            if raw and note_rng.random() < 0.1:
+                # abc脚注：文中插入a、b……标记（偶有括注拼音），段后为`a　 注释。`形式的脚注行
+                for key in "abc"[:note_rng.randint(1, 3)]:
+                    pos = note_rng.randint(1, len(paragraph) - 1)
+                    paragraph = f"{paragraph[:pos]}{key}{paragraph[pos:]}"
+                    pinyin = "（wū）" if note_rng.random() < 0.3 else ""
+                    footnotes.extend([f"{key}　 {note_rng.choice(COMMON_CHARS)}{pinyin}：{make_sentence(note_rng, 4, 12)}", ""])
+            lines.extend([paragraph, ""])
+            lines.extend(footnotes)
+            written += len(paragraph) + 1
+    return "\n".join(lines), titles
+
+def make_toc(titles: list[str]) -> str:
+    """生成与make_cjk_book配套的目录文件内容"""
+    return "\n".join(f"* {title}" for title in titles)
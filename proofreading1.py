@@ -11,6 +11,8 @@ from src.proofreader import process_paragraphs_async
 # Deepseek: deepseek-chat, deepseek-reasoner;
 # 阿里云百炼： deepseek-v3, deepseek-r1
 MODEL = "deepseek-chat"
+# 分级校对：MODEL有修改的片段再交给此模型（如"deepseek-reasoner"），None为不分级
+CASCADE_MODEL = None
 # 文件所在路径（从项目根目录开始算，根目录用`.`表示）
 ROOT_DIR = "./example"
 # 文件名列表（不含后缀`.md`）
@@ -48,7 +50,7 @@ for file_name in file_names:
 
     # 处理文本
     try:
-        asyncio.run(process_paragraphs_async(FILE_IN_JSON, FILE_PROOFREAD_JSON, start_count=1, model=MODEL, rpm=15, max_concurrent=3))
+        asyncio.run(process_paragraphs_async(FILE_IN_JSON, FILE_PROOFREAD_JSON, start_count=1, model=MODEL, rpm=15, max_concurrent=3, cascade_model=CASCADE_MODEL))
     except Exception as e:
         print(f"处理文本时出错: {str(e)}")
         exit(1)
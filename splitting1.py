@@ -1,17 +1,23 @@
 """将标题下的文字切分为带上下文的片段
 
 1. 将markdown按标题级别切分；
-2. 进一步切分为指定长度的小段（target），同时准备好完整的上下文（context）；
+2. 进一步切分为指定长度的小段（target），同时准备好上下文（context）；
 
-添加完整上下文有利于提高校对质量，同时避免一次生成过长的文本。
-TODO 还可以进一步添加参考资料（reference）
+添加上下文有利于提高校对质量，同时避免一次生成过长的文本。
+章节很长时，完整上下文的token数可达目标的几十倍，可改用前后若干字（window）或相邻片段（neighbors）。
+3. 可从参考资料文件夹中为每个片段检索相关段落，作为参考资料（reference）。
+4. 最后预估校对的token数、费用和用时（见src/planner.py），据此调整切分参数。
 """
 
 import json
 from src.splitter import split_markdown_by_title_and_length_with_context
+from src.reference_index import load_index, attach_references
+from src.planner import plan, format_plan, default_history
 
 # 文件所在路径（从项目根目录开始算，根目录用`.`表示）
 ROOT_DIR = "./example"
+# 参考资料文件夹（其中的.md、.txt文件），不用参考资料时设为None
+REFERENCE_DIR = None
 # 文件名列表（不含后缀`.md`）
 file_names = [
     'your_markdown',
@@ -43,9 +49,15 @@ for file_name in file_names:
         ############################################
         # levels: 切分标题级别，比如[1,2]表示按一级标题和二级标题切分
         # cut_by: 切分长度
-        text_list = split_markdown_by_title_and_length_with_context(text, levels=[1,2], cut_by=200)
+        # context_policy: 上下文策略，section（完整章节）、window（前后各context_chars字）、
+        #                 neighbors（标题路径加前后各context_neighbors个片段）
+        text_list = split_markdown_by_title_and_length_with_context(text, levels=[1,2], cut_by=200, context_policy="section")
         ############################################
 
+        # 检索参考资料：每个片段最多k段，不超过token_budget
+        if REFERENCE_DIR:
+            attach_references(text_list, load_index(REFERENCE_DIR), k=3, token_budget=800)
+
         # 写出json
         with open(FILE_JSON, "w", encoding="utf-8") as f:
             json.dump(text_list, f, ensure_ascii=False, indent=2)
@@ -66,3 +78,7 @@ for file_name in file_names:
             TOTAL_TARGET_LENGTH += target_length
             TOTAL_CONTEXT_LENGTH += context_length
         print(f"合计\t{TOTAL_TARGET_LENGTH}\t{TOTAL_CONTEXT_LENGTH}\t总计{TOTAL_TARGET_LENGTH+TOTAL_CONTEXT_LENGTH}")
+        print(f"上下文token数（估算）: {sum(j['context_tokens'] for j in text_list)}")
+
+        # 预估校对（按proofreading1.py的默认设置；有以前的请求记录时据以估算用时）
+        print(format_plan(plan(text_list, model="deepseek-chat", rpm=15, concurrency=3, history=default_history(FILE_JSON))))
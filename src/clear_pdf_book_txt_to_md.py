@@ -1,9 +1,26 @@
 """整理pdf书本txt文件为md文件
 
 1. 根据目录表在正文中标出标题
+2. 各整理步骤可组合为流水线（run_clean_pipeline），由配置文件驱动，多本书并行处理
 """
+import os
 import re
+import sys
 import copy
+import json
+import time
+import bisect
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+# 预编译的正则，避免每次调用都查找正则缓存
+IMAGE_PATTERN = re.compile(r'!\[image\](.+?)\{.+?\}')
+STYLE_PATTERN = re.compile(r'\[(?P<content>[^\[\]]*)\]\{.s(?P<code>\d+)( [^\{\}]*)?\}')
+# 图像链接与样式文本合并为一个正则，一次扫描完成两种替换
+IMAGE_OR_STYLE_PATTERN = re.compile(f'(?P<image>{IMAGE_PATTERN.pattern})|{STYLE_PATTERN.pattern}')
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+WRONG_SPLIT_PATTERN = re.compile(r'(.{30,}[\u4e00-\u9fff])\n{1,2}([\u4e00-\u9fff])', flags=re.MULTILINE)
+TITLE_OMIT_PATTERN = re.compile(r'[\s\da-zA-Z\[\]\{\}\.\^]')
 
 def delete_image(text):
     """
@@ -13,7 +30,7 @@ def delete_image(text):
     """
 
     # 替换图片
-    text = re.sub(r'!\[image\](.+?)\{.+?\}', r'  ', text)
+    text = IMAGE_PATTERN.sub('  ', text)
 
     return text
 
@@ -31,11 +48,20 @@ def mark_style(text, code_replace_pattern_map, default_replace_pattern=None):
 
     # 存储替换记录
     replacements = []
+    replace_style = _make_style_replacer(code_replace_pattern_map, default_replace_pattern, replacements)
 
+    # 应用替换
+    result = STYLE_PATTERN.sub(replace_style, text)
+    return result, replacements
+
+def _make_style_replacer(code_replace_pattern_map, default_replace_pattern, replacements):
+    """
+    生成样式文本的替换函数，替换记录追加到replacements
+    """
     def replace_style(match):
         original_text = match.group(0)
-        content = match.group(1).strip()
-        style_code = int(match.group(2))
+        content = match.group('content').strip()
+        style_code = int(match.group('code'))
 
         replacement = original_text  # 默认保持原样
 
@@ -57,16 +83,35 @@ def mark_style(text, code_replace_pattern_map, default_replace_pattern=None):
 
         return replacement
 
-    # 应用替换
-    result = re.sub(r'\[([^\[\]]*)\]\{.s(\d+)( [^\{\}]*)?\}', replace_style, text)
-    return result, replacements
+    return replace_style
+
+def delete_image_and_mark_style(text, code_replace_pattern_map, default_replace_pattern=None):
+    """
+    一次扫描完成delete_image和mark_style
+
+    Returns:
+        tuple: (处理后的文本, 删除的图像数, 样式替换记录列表)
+    """
+    replacements = []
+    replace_style = _make_style_replacer(code_replace_pattern_map, default_replace_pattern, replacements)
+    image_count = 0
+
+    def replace(match):
+        nonlocal image_count
+        if match.group('image') is not None:
+            image_count += 1
+            return '  '
+        return replace_style(match)
+
+    result = IMAGE_OR_STYLE_PATTERN.sub(replace, text)
+    return result, image_count, replacements
 
 
 def clean_title(title:str):
     """
     清理标题，以便比较是否一致
     """
-    return re.sub(r'[\s\da-zA-Z\[\]\{\}\.\^]', '', title.strip())
+    return TITLE_OMIT_PATTERN.sub('', title.strip())
 
 def parse_toc(content, indent_level=4, base_level=1):
     """
@@ -130,22 +175,23 @@ def mark_titles(text:list[str], toc_items:list[dict]):
     marked_lines = copy.deepcopy(text)
     not_found = []
 
+    # 每行只清理一次，按清理后的文本建立索引
+    # 移除空格、拼音、括号以便比较 TODO 需要完善
+    line_indices: dict[str, list[int]] = {}
+    for i, line in enumerate(text):
+        line_indices.setdefault(clean_title(line), []).append(i)
+
     # 标记标题
     for item in toc_items:
         item_name = item['name']
         item_level = item['level']
-        found = False
-
-        for i, line in enumerate(text):
-            # 移除空格、拼音、括号以便比较 TODO 需要完善
-            cleaned_line = clean_title(line.strip())
+        indices = line_indices.get(item_name, [])
 
-            if item_name == cleaned_line:
-                # 使用目录项的级别作为标题级别
-                marked_lines[i] = f"{'#' * item_level} {line.strip()}"
-                found = True
+        for i in indices:
+            # 使用目录项的级别作为标题级别
+            marked_lines[i] = f"{'#' * item_level} {text[i].strip()}"
 
-        if not found:
+        if not indices:
             not_found.append(item)
 
 
@@ -225,19 +271,29 @@ def mark_footnotes_from_list(marked_lines: list[str]) -> list[str]:
 
     return marked_lines
 
+def _in_spans(pos: int, starts: list[int], ends: list[int]) -> bool:
+    """
+    判断位置是否落在某个区间内（区间已按起点排序且互不重叠）
+    """
+    k = bisect.bisect_right(starts, pos) - 1
+    return k >= 0 and pos < ends[k]
+
 def mark_footnotes_from_abc(marked_lines):
     """
     整理文本中的脚注标记为markdown格式
 
     文中脚注字符集：a-z（先排除括注的拼音）
     脚注行标记为：a　 於（wū）：赞叹词。
+
+    全文只编译一个合并所有脚注键的正则，每行扫描一次；
+    拼音区间用排序后的起止位置二分查找排除。
     """
     pinyin = re.compile(r"[（\(][a-zA-Z'āáǎàōóǒòêê̄ếê̌ềēéěèīíǐìūúǔùüǖǘǚǜm̄ḿm̀ńňǹẑĉŝŋĀÁǍÀŌÓǑÒÊÊ̄ẾÊ̌ỀĒÉĚÈĪÍǏÌŪÚǓÙÜǕǗǙǛM̄ḾM̀ŃŇǸẐĈŜŊ]+[\）)]")
     footnotes_line = re.compile(r"^(\s*)([a-zA-Z])(\s+.+)$")
 
     # 创建一个字典来存储脚注
     footnotes = {}
-    footnote_lines_indices = []
+    footnote_lines_indices = set()
 
     # 第一步：识别脚注行并提取脚注内容
     for i, line in enumerate(marked_lines):
@@ -247,48 +303,45 @@ def mark_footnotes_from_abc(marked_lines):
             footnote_key = match.group(2)
             content = match.group(3)
             footnotes[footnote_key] = content
-            footnote_lines_indices.append(i)
+            footnote_lines_indices.add(i)
             # 将脚注行转换为Markdown格式
             marked_lines[i] = f"[^{footnote_key}]:{content}\n"
 
+    if not footnotes:
+        return marked_lines
+
+    # 所有脚注键合并为一个正则：前后都不是字母的独立脚注标记
+    keys = "|".join(re.escape(key) for key in sorted(footnotes))
+    footnote_ref = re.compile(f"(?<![a-zA-Z])({keys})(?![a-zA-Z])")
+
     # 处理正文中的脚注引用
     for i, line in enumerate(marked_lines):
         if i in footnote_lines_indices:
             continue  # 跳过脚注行
 
-        # 临时存储处理后的行
-        processed_line = line
-
-        # 先找出所有拼音部分，避免处理它们
-        pinyin_matches = list(pinyin.finditer(processed_line))
-        pinyin_positions = []
-
-        for match in pinyin_matches:
+        # 先找出所有拼音部分的区间，避免处理它们
+        starts = []
+        ends = []
+        for match in pinyin.finditer(line):
             start, end = match.span()
-            pinyin_positions.extend(range(start, end))
-
-        # 查找并替换脚注标记，但避开拼音部分
-        for key in footnotes.keys():
-            # 使用正则表达式查找独立的脚注标记
-            pattern = re.compile(f"(^|[^a-zA-Z])({key})($|[^a-zA-Z])")
-
-            # 查找所有匹配
-            matches = list(pattern.finditer(processed_line))
-
-            # 从后向前替换，避免位置变化
-            for match in reversed(matches):
-                start, end = match.span(2)  # 只获取脚注字符的位置
-
-                # 检查是否在拼音范围内
-                if not any(pos in pinyin_positions for pos in range(start, end)):
-                    # 替换为Markdown脚注格式
-                    processed_line = (
-                        processed_line[:start] +
-                        f"[^{key}]" +
-                        processed_line[end:]
-                    )
+            starts.append(start)
+            ends.append(end)
+
+        # 一次扫描，按原行位置拼接结果
+        pieces = []
+        last = 0
+        for match in footnote_ref.finditer(line):
+            start, end = match.span(1)
+            # 检查是否在拼音范围内
+            if starts and _in_spans(start, starts, ends):
+                continue
+            pieces.append(line[last:start])
+            pieces.append(f"[^{match.group(1)}]")
+            last = end
 
-        marked_lines[i] = processed_line
+        if pieces:
+            pieces.append(line[last:])
+            marked_lines[i] = "".join(pieces)
 
     return marked_lines
 
@@ -307,17 +360,23 @@ def make_three_files_name(file_path):
         titles_original_path = f"{file_path}.titles_original"
     return new_file_path, titles_only_path, titles_original_path
 
+@functools.lru_cache(maxsize=None)
+def _excess_blank_lines_pattern(max_blank_lines: int) -> re.Pattern:
+    """
+    匹配超过max_blank_lines个空行的正则
+    """
+    return re.compile('\n' * (max_blank_lines + 2) + '+')
+
 def delete_blank_lines(text, max_blank_lines=1):
     """
     删除文本中的空行
     """
     # 删除纯空格行
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    text = re.sub(fr'\n{"\n"*max_blank_lines}\n+', fr'\n{"\n"*max_blank_lines}\n', text)
+    text = BLANK_LINES_PATTERN.sub('\n\n', text)
+    text = _excess_blank_lines_pattern(max_blank_lines).sub('\n' * (max_blank_lines + 2), text)
 
     return text
 
-import re
 def delete_wrong_split(text: str) -> str:
     """
     删除错误分段
@@ -327,9 +386,15 @@ def delete_wrong_split(text: str) -> str:
     2. 下一行（忽略空行）开头也是汉字
     """
     # 使用多行模式 re.MULTILINE (re.M)，使 ^ 和 $ 匹配每一行的开头和结尾
-    text = re.sub(r'(.{30,}[\u4e00-\u9fff])\n{1,2}([\u4e00-\u9fff])', r'\1\2', text, flags=re.MULTILINE)
+    text = WRONG_SPLIT_PATTERN.sub(r'\1\2', text)
     return text
 
+def _is_cjk(char: str) -> bool:
+    """
+    是否为基本区汉字（U+4E00..U+9FFF）
+    """
+    return '\u4e00' <= char <= '\u9fff'
+
 def join_lines(text: str) -> str:
     """
     连接一段错误分段处
@@ -346,7 +411,7 @@ def join_lines(text: str) -> str:
         current_line = lines[i]
 
         # 检查当前行是否满足条件1：不少于30字符且最后一个字符是汉字
-        if len(current_line) >= 30 and re.match(r'[\u4e00-\u9fff]', current_line[-1]):
+        if len(current_line) >= 30 and _is_cjk(current_line[-1]):
             # 寻找下一个非空行
             next_non_empty_idx = i + 1
             while next_non_empty_idx < len(lines) and not lines[next_non_empty_idx].strip():
@@ -355,7 +420,7 @@ def join_lines(text: str) -> str:
             # 检查是否找到了下一个非空行，并且它的第一个字符是汉字
             if (next_non_empty_idx < len(lines) and
                 lines[next_non_empty_idx].strip() and
-                re.match(r'[\u4e00-\u9fff]', lines[next_non_empty_idx][0])):
+                _is_cjk(lines[next_non_empty_idx][0])):
 
                 # 连接当前行和下一个非空行
                 result_lines.append(current_line + lines[next_non_empty_idx])
@@ -370,87 +435,294 @@ def join_lines(text: str) -> str:
 
     return '\n'.join(result_lines)
 
-if __name__ == "__main__":
+# ---------------------------------------------------------------------------
+# 流水线：各步骤在同一个行列表上原地处理，按名称组合，由配置驱动
+# ---------------------------------------------------------------------------
 
-    # 处理样式文本如`[text]{.s16}`
-    style_dic = {
-        '1.21 汉魏晋六朝（上）':[(19,"zhuzm"),(20,"zhuzm"),(24,"daodu"),(25,"zhutm"),(27,"zhuzm"),(37,"zhuzm"),(38,"zhutm"),(43,"zhuzm"),],
-        '1.21 汉魏晋六朝（下册）':[(19,"zhuzm"),(20,"zhuzm"),(29,"daodu"),(30,"zhutm"),(32,"zhuzm"),(33,"zhuzm"),(40,"zhuzm"),],
-        '1.21 宋词上（未转曲）':[(20,"zhuzm"),(26,"daodu"),(28,"zhutm"),(30,"zhuzm"),(32,"zhuzm"),(35,"zhuzm"),(36,"zhuzm"),],
-        '1.21 宋词中':[(19,"zhuzm"),(20,"zhutm"),(24,"daodu"),(28,"zhuzm"),(32,"zhuzm"),(34,"zhuzm"),(37,"zhutm"),],
-        '1.21 宋词下':[(17,"zhuzm"),(25,"zhutm"),(31,"zhuzm"),(35,"zhuzm"),],
-        '1.21 宋诗':[(15,"zhuzm"),(20,"zhutm"),(23,"daodu"),(24,"zhuzm"),(27,"zhuzm"),(28,"zhuzm"),(35,"zhuzm"),],
-        '1.21 唐诗上册':[(17,"zhuzm"),(22,"zhuzm"),(25,"daodu"),(32,"zhuzm"),(33,"zhuzm"),(35,"zhuzm"),(36,"zhuzm"),(37,"zhuzm"),],
-        '1.21 唐诗中册':[(19,"zhuzm"),(23,"zhuzm"),(25,"daodu"),(26,"zhutm"),(29,"zhuzm"),(33,"zhuzm"),(36,"zhuzm"),(37,"zhuzm"),(39,"zhuzm"),],
-        '1.21 唐诗下册':[(19,"zhuzm"),(20,"zhuzm"),(21,"zhuzm"),(23,"zhuzm"),(25,"zhutm"),(28,"daodu"),(30,"zhuzm"),(34,"zhuzm"),(35,"zhuzm"),(40,"zhuzm"),],
-        '1.21 题画诗':[(18,"zhuzm"),(20,"zhutm"),(21,"zhuzm"),(25,"daodu"),(29,"zhuzm"),(33,"zhuzm"),],
-        '1.21 先秦诗':[(19,"zhuzm"),(21,"zhutm"),(28,"daodu"),(31,"zhuzm"),(38,"zhuzm"),(39,"zhutm"),(43,"zhutm"),(47,"zhuzm"),],
-        '1.21 元散曲':[(9,"zhuzm"),(10,"zhuzm"),(20,"zhuzm"),(23,"daodu"),(39,"zhuzm"),],
-        '1.21 元杂剧':[(16,"zhuzm"),(17,"zhuzm"),(19,"zhutm"),(27,"daodu"),],
-    }
+def _splice_newlines(lines: list[str]) -> None:
+    """
+    把行内的换行符拆开，保证行列表中每一项都是单独的一行
+    """
+    if any('\n' in line for line in lines):
+        lines[:] = [part for line in lines for part in line.split('\n')]
+
+def _stage_delete_image(lines: list[str], ctx: dict) -> int:
+    """删除图像链接"""
+    changes = 0
+    for i, line in enumerate(lines):
+        if '![image]' in line:
+            new_line = delete_image(line)
+            if new_line != line:
+                lines[i] = new_line
+                changes += 1
+    return changes
+
+def _stage_mark_style(lines: list[str], ctx: dict) -> int:
+    """
+    替换样式文本
 
-    # 示例文件路径
-    root_path = '13本传统文化/HTML转md及整理目录'
-    file_names = [
-        '1.21 先秦诗',
-        '1.21 汉魏晋六朝（上）',
-        '1.21 汉魏晋六朝（下册）',
-        '1.21 唐诗上册',
-        '1.21 唐诗中册',
-        '1.21 唐诗下册',
-        '1.21 宋诗',
-        '1.21 宋词上（未转曲）',
-        '1.21 宋词中',
-        '1.21 宋词下',
-        '1.21 题画诗',
-        '1.21 元散曲',
-        '1.21 元杂剧',
-    ]
-    for file_name in file_names:
-
-        file_path = f'{root_path}/{file_name}.md'
-        with open(file_path, 'r', encoding='utf-8') as file:
-            text = file.read()
-
-        # 删除图像链接
-        text = delete_image(text)
-
-        # 替换样式
-        # 定义替换模板，使用$1作为内容占位符
-        style_replace_pattern = {
-            "zhuzm": "[^$1]",
-            "zhutm": "\n\n[^$1]: ",
-            "daodu": "【$1】"
+    pandoc使用`--wrap=none`转换时，样式文本不会跨行，因此可以逐行处理
+    """
+    style_replace_pattern = ctx.get('style_replace_pattern', {})
+    code_replace_pattern_map = {int(code): style_replace_pattern[style] for code, style in ctx.get('styles', {}).items()}
+    default_replace_pattern = ctx.get('default_replace_pattern')
+    changes = 0
+    for i, line in enumerate(lines):
+        if ']{.s' in line:
+            new_line, replacements = mark_style(line, code_replace_pattern_map, default_replace_pattern)
+            lines[i] = new_line
+            changes += len(replacements)
+    _splice_newlines(lines)
+    return changes
+
+def _stage_delete_image_and_mark_style(lines: list[str], ctx: dict) -> int:
+    """一次扫描删除图像链接并替换样式文本"""
+    style_replace_pattern = ctx.get('style_replace_pattern', {})
+    code_replace_pattern_map = {int(code): style_replace_pattern[style] for code, style in ctx.get('styles', {}).items()}
+    default_replace_pattern = ctx.get('default_replace_pattern')
+    changes = 0
+    for i, line in enumerate(lines):
+        if '![image]' in line or ']{.s' in line:
+            new_line, image_count, replacements = delete_image_and_mark_style(line, code_replace_pattern_map, default_replace_pattern)
+            lines[i] = new_line
+            changes += image_count + len(replacements)
+    _splice_newlines(lines)
+    return changes
+
+def _stage_mark_footnotes_from_list(lines: list[str], ctx: dict) -> int:
+    """标记脚注"""
+    before = list(lines)
+    mark_footnotes_from_list(lines)
+    changes = sum(1 for a, b in zip(before, lines) if a != b)
+    _splice_newlines(lines)
+    return changes
+
+def _stage_strip_indent(lines: list[str], ctx: dict) -> int:
+    """删除行头空格"""
+    changes = 0
+    for i, line in enumerate(lines):
+        stripped = line.lstrip()
+        if stripped != line:
+            lines[i] = stripped
+            changes += 1
+    return changes
+
+def _stage_delete_blank_lines(lines: list[str], ctx: dict) -> int:
+    """删除多余空行，纯空格行视为空行"""
+    max_blank_lines = ctx.get('max_blank_lines', 1)
+    result = []
+    changes = 0
+    blank_run = 0
+    for line in lines:
+        if line.strip():
+            blank_run = 0
+            result.append(line)
+            continue
+        blank_run += 1
+        if blank_run <= max_blank_lines:
+            result.append('')
+            if line:
+                changes += 1
+        else:
+            changes += 1
+    lines[:] = result
+    return changes
+
+def _stage_join_broken_words(lines: list[str], ctx: dict) -> int:
+    """
+    连接被空行拆开的词，如“前\n\n言”“目\n\n录”
+    """
+    words = ctx.get('broken_words', ['前言', '目录'])
+    pairs = {(w[0], w[1:]): w for w in words if len(w) > 1}
+    result = []
+    changes = 0
+    i = 0
+    while i < len(lines):
+        if i + 2 < len(lines) and not lines[i+1] and (lines[i], lines[i+2]) in pairs:
+            result.append(pairs[(lines[i], lines[i+2])])
+            changes += 1
+            i += 3
+            continue
+        result.append(lines[i])
+        i += 1
+    lines[:] = result
+    return changes
+
+def _stage_mark_titles(lines: list[str], ctx: dict) -> int:
+    """根据目录标记标题"""
+    toc_path = ctx.get('toc')
+    if not toc_path or not os.path.exists(toc_path):
+        return 0
+    with open(toc_path, 'r', encoding='utf-8') as file:
+        toc_items = parse_toc(file.read())
+    marked_lines, not_found = mark_titles(lines, toc_items)
+    changes = sum(1 for a, b in zip(lines, marked_lines) if a != b)
+    lines[:] = marked_lines
+    ctx['not_found'] = not_found
+    return changes
+
+def _stage_delete_wrong_split(lines: list[str], ctx: dict) -> int:
+    """
+    删除错误分段，规则与delete_wrong_split一致：
+    一行不少于30字符且最后一个是汉字，下一行（至多隔一个空行）开头也是汉字
+    """
+    result = []
+    changes = 0
+    n = len(lines)
+    i = 0
+    while i < n:
+        current = lines[i]
+        # 可供匹配的行尾长度；连接后，下一行的首字已被上一次匹配占用
+        tail = len(current)
+        i += 1
+        while tail >= 31 and _is_cjk(current[-1]):
+            if i < n and lines[i] and _is_cjk(lines[i][0]):
+                next_idx = i
+            elif i + 1 < n and not lines[i] and lines[i+1] and _is_cjk(lines[i+1][0]):
+                next_idx = i + 1
+            else:
+                break
+            current += lines[next_idx]
+            tail = len(lines[next_idx]) - 1
+            i = next_idx + 1
+            changes += 1
+        result.append(current)
+    lines[:] = result
+    return changes
+
+CLEAN_STAGES = {
+    'delete_image': _stage_delete_image,
+    'mark_style': _stage_mark_style,
+    'delete_image_and_mark_style': _stage_delete_image_and_mark_style,
+    'mark_footnotes_from_list': _stage_mark_footnotes_from_list,
+    'strip_indent': _stage_strip_indent,
+    'delete_blank_lines': _stage_delete_blank_lines,
+    'join_broken_words': _stage_join_broken_words,
+    'mark_titles': _stage_mark_titles,
+    'delete_wrong_split': _stage_delete_wrong_split,
+}
+
+DEFAULT_STAGES = [
+    'delete_image_and_mark_style',
+    'mark_footnotes_from_list',
+    'strip_indent',
+    'delete_blank_lines',
+    'join_broken_words',
+    'mark_titles',
+    'delete_wrong_split',
+]
+
+def run_clean_pipeline(text: str, ctx: dict, stages: list[str]|None=None) -> tuple[str, list[dict]]:
+    """
+    在同一个行列表上依次执行各步骤
+
+    Args:
+        text: 待整理的文本
+        ctx: 步骤参数（styles、style_replace_pattern、toc等），步骤也可写回结果，如not_found
+        stages: 步骤名称列表，默认为DEFAULT_STAGES
+
+    Returns:
+        tuple: (处理后的文本, 各步骤记录[{'stage', 'seconds', 'changes'}, ...])
+    """
+    lines = text.split('\n')
+    report = []
+    for name in stages or DEFAULT_STAGES:
+        if name not in CLEAN_STAGES:
+            raise ValueError(f"未知的整理步骤: {name}")
+        start_time = time.perf_counter()
+        changes = CLEAN_STAGES[name](lines, ctx)
+        report.append({
+            'stage': name,
+            'seconds': time.perf_counter() - start_time,
+            'changes': changes,
+        })
+    return '\n'.join(lines), report
+
+def load_clean_config(config_path: str) -> dict:
+    """
+    读取整理配置（JSON）
+
+    格式：
+    {
+        "root_path": "书稿所在路径",
+        "stages": ["delete_image", ...],          // 可选，默认DEFAULT_STAGES
+        "style_replace_pattern": {"zhuzm": "[^$1]", ...},
+        "default_replace_pattern": "$1",
+        "books": {
+            "书名": {"styles": {"19": "zhuzm", ...}, "toc": "书名.目录.md"}
         }
-        # 创建样式码到替换模式的映射
-        code_replace_pattern_map = {x[0]: style_replace_pattern[x[1]] for x in style_dic[file_name]}
-        text, replacement_records = mark_style(text, code_replace_pattern_map, default_replace_pattern="$1")
-        print(replacement_records)
-
-        # 标记脚注
-        lines = mark_footnotes_from_list(text.split('\n'))
-
-        # 删除行头空格
-        lines = [line.lstrip() for line in lines]
-        # 删除空行
-        text = delete_blank_lines("\n".join(lines))
-        # 连接前言和目录行
-        text = re.sub(r'\n前\n\n言\n', r'\n前言\n',text)
-        text = re.sub(r'\n目\n\n录\n', r'\n目录\n',text)
-
-        # # 标记标题
-        # 整理好的目录列表
-        with open(f'{root_path}/{file_name}.目录.md', 'r', encoding='utf-8') as file:
-            content = file.read()
-        toc_items = parse_toc(content)
-        lines, not_found = mark_titles(text.split('\n'), toc_items)
-        if not_found:
-            print("\n未找到的目录项:")
-            for item in not_found:
-                print(f"- {item['name']} (级别: {item['level']})")
-
-        # 删除错误分段
-        text = delete_wrong_split("\n".join(lines))
-
-        with open(f'{root_path}/{file_name}.clean.md', 'w', encoding='utf-8') as file:
-            file.writelines(text)
\ No newline at end of file
+    }
+    书的toc缺省为`书名.目录.md`；书的配置项可覆盖全局配置项
+    """
+    with open(config_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def make_book_context(config: dict, book_name: str) -> dict:
+    """
+    合并全局配置与单本书配置，得到该书的步骤参数
+    """
+    root_path = config.get('root_path', '.')
+    ctx = {k: v for k, v in config.items() if k not in ('books', 'root_path')}
+    ctx.update(config.get('books', {}).get(book_name, {}))
+    ctx['toc'] = os.path.join(root_path, ctx.get('toc', f'{book_name}.目录.md'))
+    ctx['input'] = os.path.join(root_path, f'{book_name}.md')
+    ctx['output'] = os.path.join(root_path, f'{book_name}.clean.md')
+    return ctx
+
+def clean_book(config: dict, book_name: str) -> dict:
+    """
+    整理一本书，写出`书名.clean.md`
+
+    Returns:
+        dict: {'name', 'seconds', 'report', 'not_found'}
+    """
+    start_time = time.perf_counter()
+    ctx = make_book_context(config, book_name)
+    with open(ctx['input'], 'r', encoding='utf-8') as file:
+        text = file.read()
+
+    text, report = run_clean_pipeline(text, ctx, config.get('stages'))
+
+    with open(ctx['output'], 'w', encoding='utf-8') as file:
+        file.write(text)
+
+    return {
+        'name': book_name,
+        'seconds': time.perf_counter() - start_time,
+        'report': report,
+        'not_found': ctx.get('not_found', []),
+    }
+
+def clean_books(config: dict, book_names: list[str]|None=None, max_workers: int|None=None) -> list[dict]:
+    """
+    多进程并行整理多本书，结果按book_names的顺序返回
+    """
+    if book_names is None:
+        book_names = list(config.get('books', {}))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(clean_book, config, name) for name in book_names]
+        return [future.result() for future in futures]
+
+def print_clean_result(result: dict) -> None:
+    """
+    打印一本书的各步骤用时、改动数和未找到的目录项
+    """
+    print(f"\n【{result['name']}】用时 {result['seconds']:.2f}s")
+    print(f"{'步骤':<30}用时\t改动数\n{'-'*48}")
+    for record in result['report']:
+        print(f"{record['stage']:<32}{record['seconds']:.3f}s\t{record['changes']}")
+    if result['not_found']:
+        print("未找到的目录项:")
+        for item in result['not_found']:
+            print(f"- {item['name']} (级别: {item['level']})")
+
+
+if __name__ == "__main__":
+
+    # 整理配置：书稿路径、样式替换表、目录文件等，见load_clean_config
+    # 用法：python clear_pdf_book_txt_to_md.py [配置文件路径]
+    CONFIG_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clean_config.json')
+
+    clean_config = load_clean_config(CONFIG_PATH)
+    for book_result in clean_books(clean_config):
+        print_clean_result(book_result)
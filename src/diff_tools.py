@@ -3,8 +3,13 @@
 import difflib
 
 from typing import List
-from splitter import split_markdown_by_title
-from clear_pdf_book_txt_to_md import clean_title
+try:
+    from splitter import split_markdown_by_title
+    from clear_pdf_book_txt_to_md import clean_title
+except ImportError:
+    # 作为src包的模块导入时（如python -m src.pipeline）
+    from src.splitter import split_markdown_by_title
+    from src.clear_pdf_book_txt_to_md import clean_title
 
 
 def split_md_text(text1, text2,  levels:List[int]|None=None):
@@ -1,27 +1,103 @@
-"""批处理
+"""批处理：用pandoc批量转换html为md
+
+多个pandoc进程并行（默认与CPU核数相同）；
+输出文件比输入文件新时跳过，可重复运行；
+最后报告每个文件的用时和失败原因。
 """
 import os
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+PANDOC_ARGS = ['-f', 'html', '-t', 'markdown-smart+pipe_tables+footnotes', '--wrap=none', '--toc']
+
+
+def is_up_to_date(file_in: str, file_out: str) -> bool:
+    """
+    输出文件存在且比输入文件新
+    """
+    return os.path.exists(file_out) and os.path.getmtime(file_out) >= os.path.getmtime(file_in)
+
+
+def pandoc_convert(file_in: str, file_out: str, force: bool=False, timeout: int=600) -> dict:
+    """
+    调用pandoc转换一个文件
+
+    先写到临时文件，成功后再改名，失败时不会留下半截的输出
+
+    Returns:
+        dict: {'file', 'status': 'done'|'skipped'|'failed', 'seconds', 'error'}
+    """
+    result = {'file': file_in, 'status': 'done', 'seconds': 0.0, 'error': ''}
+    if not os.path.exists(file_in):
+        result['status'] = 'failed'
+        result['error'] = "输入文件不存在"
+        return result
+    if not force and is_up_to_date(file_in, file_out):
+        result['status'] = 'skipped'
+        return result
+
+    tmp_out = f"{file_out}.tmp"
+    start_time = time.perf_counter()
+    try:
+        completed = subprocess.run(
+            ['pandoc', *PANDOC_ARGS, file_in, '-o', tmp_out],
+            capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=timeout, check=False,
+        )
+        if completed.returncode == 0:
+            os.replace(tmp_out, file_out)
+        else:
+            result['status'] = 'failed'
+            result['error'] = completed.stderr.strip() or f"pandoc返回{completed.returncode}"
+    except (OSError, subprocess.TimeoutExpired) as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    finally:
+        if os.path.exists(tmp_out):
+            os.remove(tmp_out)
+    result['seconds'] = time.perf_counter() - start_time
+    return result
+
+
+def convert_html_files(root_dir: str, file_names: list[str], max_workers: int|None=None, force: bool=False) -> list[dict]:
+    """
+    并行转换root_dir中的`文件名.html`为`文件名.md`，结果按file_names的顺序返回
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    jobs = [(os.path.join(root_dir, f"{name}.html"), os.path.join(root_dir, f"{name}.md")) for name in file_names]
+    # pandoc在子进程中运行，线程只负责等待，因此用线程池限制同时运行的进程数
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: pandoc_convert(*job, force=force), jobs))
+
+
+if __name__ == "__main__":
+
+    root_dir = '13本传统文化'
+
+    file_list = [
+        '1.21 汉魏晋六朝（上）',
+        '1.21 汉魏晋六朝（下册）',
+        '1.21 宋词上（未转曲）',
+        '1.21 宋词下',
+        '1.21 宋词中',
+        '1.21 宋诗',
+        '1.21 唐诗上册',
+        '1.21 唐诗下册',
+        '1.21 唐诗中册',
+        '1.21 题画诗',
+        '1.21 先秦诗',
+        '1.21 元散曲',
+        '1.21 元杂剧',
+    ]
+
+    # 批量转换html为md
+    results = convert_html_files(root_dir, file_list)
 
-root_dir = '13本传统文化'
-
-file_list = [
-    '1.21 汉魏晋六朝（上）',
-    '1.21 汉魏晋六朝（下册）',
-    '1.21 宋词上（未转曲）',
-    '1.21 宋词下',
-    '1.21 宋词中',
-    '1.21 宋诗',
-    '1.21 唐诗上册',
-    '1.21 唐诗下册',
-    '1.21 唐诗中册',
-    '1.21 题画诗',
-    '1.21 先秦诗',
-    '1.21 元散曲',
-    '1.21 元杂剧',
-]
-
-# 批量转换html为md
-for file in file_list:
-    c = f'pandoc -f html -t markdown-smart+pipe_tables+footnotes --wrap=none --toc  "{root_dir}\\{file}.html" -o "{root_dir}\\{file}.md"'
-    print(c)
-    os.system(c)
+    print(f"文件\t状态\t用时\n{'-'*40}")
+    for r in results:
+        print(f"{r['file']}\t{r['status']}\t{r['seconds']:.2f}s")
+    failed = [r for r in results if r['status'] == 'failed']
+    if failed:
+        print(f"\n失败{len(failed)}个:")
+        for r in failed:
+            print(f"- {r['file']}: {r['error']}")
@@ -0,0 +1,204 @@
+"""
+API key池：同一家接口有多个API key时，轮流使用
+
+1. 每个key记录最近一分钟的请求数、token数（RPM/TPM）；
+2. 每次请求选用余量最多的key（设置了上限时按余量比例，否则选最近用得最少的）；
+   所有key都已达到上限或在暂停中时，等到最早有key可用；
+3. 返回认证错误（401、403）的key停用到运行结束，返回额度错误（402、429）的key暂停一段时间，
+   再次出错时暂停时间加倍。
+
+在.env中配置，多个key用逗号分隔，或另加编号的变量；上限可选：
+    DEEPSEEK_API_KEY=key1,key2
+    DEEPSEEK_API_KEY_3=key3
+    DEEPSEEK_API_KEY_RPM=60
+    DEEPSEEK_API_KEY_TPM=100000
+"""
+import os
+import time
+import threading
+import functools
+from collections import deque
+
+# 额度错误后暂停的秒数（再次出错时加倍，最多QUARANTINE_MAX）
+QUARANTINE_SECONDS = 60
+QUARANTINE_MAX = 900
+# 等待key可用时，两次检查的最短间隔（秒）
+KEY_WAIT_MIN = 0.1
+AUTH_ERROR_CODES = (401, 403)
+QUOTA_ERROR_CODES = (402, 429)
+
+
+def load_keys(env_name: str) -> list[str]:
+    """
+    读取环境变量env_name（逗号分隔）及env_name_2、env_name_3……中的key，去重保序
+    """
+    values = [os.getenv(env_name, "")]
+    n = 1
+    while True:
+        n += 1
+        value = os.getenv(f"{env_name}_{n}")
+        if value is None:
+            break
+        values.append(value)
+    keys = []
+    for value in values:
+        for key in value.split(","):
+            key = key.strip()
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+
+def error_status(error: Exception) -> int|None:
+    """
+    异常中的HTTP状态码（openai的status_code，google的code）
+    """
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+class KeyPool:
+    """
+    一家接口的API key池
+    """
+    def __init__(self, keys: list[str], rpm: int|None=None, tpm: int|None=None, name: str=""):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.lock = threading.Lock()
+        # 每个key: 最近一分钟的(时间, token数)、暂停到何时、暂停秒数、是否停用、请求数、出错数
+        self.keys = {key: {"calls": deque(), "quarantined_until": 0.0, "quarantine": QUARANTINE_SECONDS,
+                           "disabled": False, "requests": 0, "errors": 0} for key in keys}
+
+    def _usage(self, state: dict, now: float) -> tuple[int, int]:
+        calls = state["calls"]
+        while calls and now - calls[0][0] > 60:
+            calls.popleft()
+        return len(calls), sum(tokens for _, tokens in calls)
+
+    def _headroom(self, state: dict, now: float) -> float:
+        requests, tokens = self._usage(state, now)
+        ratios = []
+        if self.rpm:
+            ratios.append(1 - requests / self.rpm)
+        if self.tpm:
+            ratios.append(1 - tokens / self.tpm)
+        if ratios:
+            return min(ratios)
+        # 没有设置上限：最近用得越少余量越多
+        return -requests
+
+    def _has_room(self, state: dict, now: float, tokens: int) -> bool:
+        # 再发一个请求（估算tokens个token）是否不超过RPM/TPM上限；单个请求超过TPM时，等一分钟内没有别的请求
+        requests, used = self._usage(state, now)
+        if self.rpm and requests >= self.rpm:
+            return False
+        if self.tpm and used and used + tokens > self.tpm:
+            return False
+        return True
+
+    def _ready_in(self, state: dict, now: float, tokens: int) -> float:
+        # 该key大约多少秒后可用：暂停结束，达到上限的还要等最早的一次请求移出一分钟的窗口
+        wait = state["quarantined_until"] - now
+        if state["calls"] and not self._has_room(state, now, tokens):
+            wait = max(wait, state["calls"][0][0] + 60 - now)
+        return max(wait, KEY_WAIT_MIN)
+
+    def acquire(self, tokens: int=0, cancel: threading.Event|None=None) -> str|None:
+        """
+        选用余量最多的key，并记下这次请求（估算的token数）；
+        所有key都在暂停中或已达到RPM/TPM上限时，等到最早有key可用；
+        都已停用，或等待中cancel被设置时，返回None
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                usable = [(key, state) for key, state in self.keys.items() if not state["disabled"]]
+                if not usable:
+                    return None
+                ready = [(key, state) for key, state in usable
+                         if state["quarantined_until"] <= now and self._has_room(state, now, tokens)]
+                if ready:
+                    key, state = max(ready, key=lambda item: self._headroom(item[1], now))
+                    state["calls"].append((now, tokens))
+                    state["requests"] += 1
+                    return key
+                delay = min(self._ready_in(state, now, tokens) for _, state in usable)
+            if cancel is not None:
+                if cancel.wait(delay):
+                    return None
+            else:
+                time.sleep(delay)
+
+    def release(self, key: str, tokens: int|None=None) -> None:
+        """
+        请求成功：用实际的token数更正记录，解除暂停的加倍
+        """
+        with self.lock:
+            state = self.keys[key]
+            state["quarantine"] = QUARANTINE_SECONDS
+            if tokens is not None and state["calls"]:
+                # 更正该key最近一次请求的token数（并发时不一定是同一次，总数不受影响）
+                when, _ = state["calls"].pop()
+                state["calls"].append((when, tokens))
+
+    def report_error(self, key: str, error: Exception) -> str|None:
+        """
+        请求出错：认证错误停用该key，额度错误暂停该key；返回"disabled"、"quarantined"或None
+        """
+        status = error_status(error)
+        with self.lock:
+            state = self.keys[key]
+            state["errors"] += 1
+            if status in AUTH_ERROR_CODES:
+                state["disabled"] = True
+                print(f"{self.name} 的API key {mask_key(key)} 认证失败，本次运行不再使用")
+                return "disabled"
+            if status in QUOTA_ERROR_CODES:
+                state["quarantined_until"] = time.time() + state["quarantine"]
+                print(f"{self.name} 的API key {mask_key(key)} 超出额度，暂停 {state['quarantine']}s")
+                state["quarantine"] = min(state["quarantine"] * 2, QUARANTINE_MAX)
+                return "quarantined"
+        return None
+
+    def available(self) -> int:
+        """
+        现在可用（未停用、未暂停）的key数
+        """
+        with self.lock:
+            now = time.time()
+            return sum(1 for state in self.keys.values() if not state["disabled"] and state["quarantined_until"] <= now)
+
+    def status(self) -> list[dict]:
+        """
+        各key的状态（key已打码）
+        """
+        with self.lock:
+            now = time.time()
+            rows = []
+            for key, state in self.keys.items():
+                requests, tokens = self._usage(state, now)
+                rows.append({"key": mask_key(key), "rpm": requests, "tpm": tokens,
+                             "requests": state["requests"], "errors": state["errors"],
+                             "disabled": state["disabled"], "quarantined": state["quarantined_until"] > now})
+            return rows
+
+
+def mask_key(key: str) -> str:
+    """日志中只显示key的首尾几位"""
+    return f"{key[:4]}…{key[-4:]}" if len(key) > 12 else "…"
+
+
+@functools.lru_cache(maxsize=None)
+def get_key_pool(env_name: str) -> KeyPool:
+    """
+    按环境变量名创建（并复用）key池；上限读取env_name_RPM、env_name_TPM
+    """
+    from src.proofreader import load_env
+    load_env()
+    rpm = os.getenv(f"{env_name}_RPM")
+    tpm = os.getenv(f"{env_name}_TPM")
+    return KeyPool(load_keys(env_name), int(rpm) if rpm else None, int(tpm) if tpm else None, name=env_name)
@@ -28,6 +28,16 @@ def find_best_match(
         'ratio': 0
         }
 
+    # 原文中有完全相同的片段时，结果与滑动窗口查找相同（第一处，相似度100），不必逐一比较
+    location = text.find(fragment) if fragment else -1
+    if location >= 0:
+        best_match.update({
+            'real_text': fragment,
+            'location': (location, location+len(fragment)),
+            'ratio': 100
+        })
+        return best_match
+
     # 使用滑动窗口在原文中查找，窗口大小有±offset字符的弹性
     base_window_size = len(fragment)
     for window_size in range(base_window_size - len_offset, base_window_size + len_offset):
@@ -88,16 +98,20 @@ def apply_replacements(text: str,
         str: 替换后的文本
     """
     result_text = text
+    # 已替换部分的起点，与之重叠的替换跳过
+    applied_start = len(text)
 
-    # 从后向前替换，避免位置变化影响后续替换
+    # 按位置从后向前替换，避免位置变化影响后续替换；只替换找到的那一处
     for info in sorted(replacement_info,
                       key=lambda x: x['location'][0] if x['location'] else -1,
                       reverse=True):
         if info['real_text'] and info['location'] and info['ratio'] >= similarity_threshold:
-            if info['real_text'] in result_text:
-                result_text = result_text.replace(info['real_text'], info['modified_text'])
-            else:
-                print(f"替换失败: 未找到文本 '{info['real_text']}'")
+            start, end = info['location']
+            if end > applied_start:
+                print(f"替换失败: 与其他替换重叠 '{info['real_text']}'")
+                continue
+            result_text = result_text[:start] + info['modified_text'] + result_text[end:]
+            applied_start = start
 
     return result_text
 
@@ -1,37 +1,222 @@
 """使用marker将pdf转换为markdown
 
-大文件出错；不用大模型时质量跟acrobat转HTML再转md差不多；
+不用大模型时质量跟acrobat转HTML再转md差不多；
+
+大文件整体转换容易出错，因此按页码范围切分，多个进程并行转换后按顺序拼接：
+1. 每个工作进程只加载一次版面、OCR模型，处理多个页码范围；
+2. 每个页码范围转换完就写入检查点（`输出文件.parts/起始页-结束页.md`），
+   中途崩溃后重新运行，只转换尚未完成的范围；检查点目录中的manifest.json记录pdf的内容哈希和每个范围的页数，
+   pdf或页数有变化时清除旧的检查点，全部重新转换；
+3. 全部完成后按页码顺序拼接为输出文件。
+
+用法：python pdf2md.py <input_pdf_path> <output_md_path> [--pages 50] [--workers 2]
 """
+import os
 import sys
-from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
-from marker.output import text_from_rendered
-from marker.config.parser import ConfigParser
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-config = {
+CONFIG = {
     "output_format": "markdown",
     # "ADDITIONAL_KEY": "VALUE"
 }
 
-config_parser = ConfigParser(config)
+# 每个进程只加载一次的模型
+_ARTIFACT_DICT = None
+MANIFEST_NAME = "manifest.json"
+
+
+def set_device(device: str|None=None) -> None:
+    """
+    设置模型运行设备；marker在首次导入时读取TORCH_DEVICE，须在导入marker的任何模块之前调用
+    """
+    if device:
+        os.environ["TORCH_DEVICE"] = device
+
+
+def load_models(device: str|None=None) -> dict:
+    """
+    加载（并缓存）marker的版面、OCR等模型
+
+    Args:
+        device: 如"cpu"，为None时由marker自行选择
+    """
+    global _ARTIFACT_DICT
+    if _ARTIFACT_DICT is None:
+        set_device(device)
+        from marker.models import create_model_dict
+        _ARTIFACT_DICT = create_model_dict()
+    return _ARTIFACT_DICT
+
+
+def convert_pages(input_pdf_path: str, page_range: tuple[int, int]|None=None, device: str|None=None) -> str:
+    """
+    转换pdf的一个页码范围（0起，含两端），返回markdown文本
+    """
+    set_device(device)
+    from marker.converters.pdf import PdfConverter
+    from marker.output import text_from_rendered
+    from marker.config.parser import ConfigParser
+
+    config = dict(CONFIG)
+    if page_range is not None:
+        config["page_range"] = f"{page_range[0]}-{page_range[1]}"
+    config_parser = ConfigParser(config)
+
+    converter = PdfConverter(
+        artifact_dict=load_models(device),
+        config=config_parser.generate_config_dict(),
+        processor_list=config_parser.get_processors(),
+        renderer=config_parser.get_renderer(),
+        # llm_service=config_parser.get_llm_service(),
+    )
+    rendered = converter(input_pdf_path)
+    text, _, _ = text_from_rendered(rendered)
+    return text
+
+
+def count_pages(input_pdf_path: str) -> int:
+    """
+    pdf的页数
+    """
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(input_pdf_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def split_page_ranges(page_count: int, pages_per_range: int=50) -> list[tuple[int, int]]:
+    """
+    把页码切分为若干范围（0起，含两端）
+    """
+    pages_per_range = max(1, pages_per_range)
+    return [(start, min(start + pages_per_range, page_count) - 1)
+            for start in range(0, page_count, pages_per_range)]
+
+
+def part_path(parts_dir: str, page_range: tuple[int, int]) -> str:
+    """
+    页码范围对应的检查点文件
+    """
+    return os.path.join(parts_dir, f"{page_range[0]:05d}-{page_range[1]:05d}.md")
+
+
+def file_sha256(path: str) -> str:
+    """
+    文件内容的sha256
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_parts_dir(parts_dir: str, input_pdf_path: str, pages_per_range: int) -> None:
+    """
+    检查点目录与pdf内容、每个范围的页数不符（或没有manifest）时，清除旧的检查点并写入新的manifest
+    """
+    os.makedirs(parts_dir, exist_ok=True)
+    manifest = {"pdf_sha256": file_sha256(input_pdf_path), "pages_per_range": max(1, pages_per_range)}
+    manifest_path = os.path.join(parts_dir, MANIFEST_NAME)
+    old = None
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                old = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            old = None
+    if old == manifest:
+        return
+    stale = [name for name in os.listdir(parts_dir) if name.endswith((".md", ".md.tmp"))]
+    for name in stale:
+        os.remove(os.path.join(parts_dir, name))
+    if stale:
+        print(f"pdf或页码范围有变化，清除{len(stale)}个旧的检查点")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def _convert_part(input_pdf_path: str, page_range: tuple[int, int], parts_dir: str, device: str|None) -> tuple[int, int]:
+    """
+    转换一个页码范围并写入检查点（先写临时文件再改名，避免留下半截文件）
+    """
+    text = convert_pages(input_pdf_path, page_range, device)
+    path = part_path(parts_dir, page_range)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(f"{path}.tmp", path)
+    return page_range
+
+
+def _init_worker(device: str|None):
+    """
+    工作进程启动时加载模型，之后处理的所有页码范围共用
+    """
+    load_models(device)
+
+
+def convert_pdf(input_pdf_path: str, output_md_path: str, pages_per_range: int=50,
+                max_workers: int=1, device: str|None="cpu") -> str:
+    """
+    按页码范围并行转换pdf，按顺序拼接，写出markdown文件
+
+    Args:
+        input_pdf_path: pdf路径
+        output_md_path: 输出markdown路径
+        pages_per_range: 每个范围的页数
+        max_workers: 并行的工作进程数（每个进程各加载一份模型，注意内存）
+        device: 模型运行设备，默认"cpu"
+
+    Returns:
+        str: 拼接后的markdown文本
+    """
+    parts_dir = f"{output_md_path}.parts"
+    prepare_parts_dir(parts_dir, input_pdf_path, pages_per_range)
+
+    page_ranges = split_page_ranges(count_pages(input_pdf_path), pages_per_range)
+    pending = [r for r in page_ranges if not os.path.exists(part_path(parts_dir, r))]
+    print(f"共{len(page_ranges)}个页码范围，已完成{len(page_ranges) - len(pending)}个")
+
+    if pending:
+        if max_workers <= 1:
+            for page_range in pending:
+                _convert_part(input_pdf_path, page_range, parts_dir, device)
+                print(f"完成第{page_range[0]+1}-{page_range[1]+1}页")
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(device,)) as executor:
+                futures = [executor.submit(_convert_part, input_pdf_path, r, parts_dir, device) for r in pending]
+                for future in futures:
+                    page_range = future.result()
+                    print(f"完成第{page_range[0]+1}-{page_range[1]+1}页")
+
+    texts = []
+    for page_range in page_ranges:
+        with open(part_path(parts_dir, page_range), "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    text = "\n\n".join(texts)
 
-converter = PdfConverter(
-    artifact_dict=create_model_dict(),
-    config=config_parser.generate_config_dict(),
-    processor_list=config_parser.get_processors(),
-    renderer=config_parser.get_renderer(),
-    # llm_service=config_parser.get_llm_service(),
-)
+    with open(output_md_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return text
 
-if len(sys.argv) != 3:
-    print("Usage: python pdf2md.py <input_pdf_path> <output_md_path>")
-    sys.exit(1)
 
-input_pdf_path = sys.argv[1]
-output_md_path = sys.argv[2]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用marker将pdf转换为markdown")
+    parser.add_argument("input_pdf_path")
+    parser.add_argument("output_md_path")
+    parser.add_argument("--pages", type=int, default=50, help="每个页码范围的页数，默认50")
+    parser.add_argument("--workers", type=int, default=1, help="并行工作进程数，默认1")
+    parser.add_argument("--device", default="cpu", help="模型运行设备，默认cpu")
+    args = parser.parse_args()
 
-rendered = converter(input_pdf_path)
-text, _, images = text_from_rendered(rendered)
+    if not os.path.exists(args.input_pdf_path):
+        print(f"错误：输入文件 {args.input_pdf_path} 不存在")
+        sys.exit(1)
 
-with open(output_md_path, "w", encoding="utf-8") as f:
-    f.write(text)
+    convert_pdf(args.input_pdf_path, args.output_md_path, args.pages, args.workers, args.device)
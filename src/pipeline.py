@@ -0,0 +1,390 @@
+"""
+书稿处理流水线：转换 → 整理 → 切分 → 校对 → 比较
+
+1. 每本书的各步骤构成有向无环图，按依赖顺序执行；
+2. 每一步记录输入指纹（输入文件的内容哈希加参数），指纹不变且输出完整时跳过，
+   类似make，但比较内容而不是修改时间；上游重跑后输出内容不变，下游也不重跑；
+3. 校对结果按片段内容缓存，切分结果变化后只校对内容变化了的片段；
+4. 多本书并行处理。
+
+配置文件沿用clean_config.json的格式（见clear_pdf_book_txt_to_md.load_clean_config），另加：
+    "steps": ["convert", "clean", "split", "proofread", "diff"],   // 可选
+    "split": {"method": "title_length_context", "levels": [1, 2], "cut_by": 600, "context_policy": "section",
+              "reference_dir": "参考资料文件夹", "reference_k": 3, "reference_budget": 800},   // 参考资料可选，见reference_index
+    "proofread": {"model": "deepseek-chat", "rpm": 15, "max_concurrent": 3},   // 另可加priority、chapter、deadline、mode、cascade_model、hedge_budget、hedge_model，见proofreader
+    "jobs": 2    // 并行处理的书数
+
+书稿源文件为`书名.pdf`、`书名.html`或`书名.md`，依次查找；
+指纹保存在`root_path/.pipeline/书名.json`，片段校对缓存在`root_path/.pipeline/书名.segments.json`，
+校对结果各片段的指纹在`root_path/.pipeline/书名.keys.json`。
+
+用法（在项目根目录）：python -m src.pipeline [配置文件路径]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from src.clear_pdf_book_txt_to_md import load_clean_config, make_book_context, clean_book
+from src.proofreader import process_paragraphs_async, write_json_atomic, fast_result_key
+from src.splitter import (
+    cut_text_by_length,
+    piece_joiners,
+    split_markdown_by_title,
+    split_markdown_by_title_and_length_with_context,
+    split_markdown_by_title_and_length_and_merge,
+)
+
+DEFAULT_STEPS = ["convert", "clean", "split", "proofread", "diff"]
+STATE_DIR = ".pipeline"
+# 流水线自身的配置项，不影响整理步骤
+PIPELINE_KEYS = ("steps", "split", "proofread", "jobs")
+
+
+def hash_file(path: str) -> str:
+    """
+    文件内容的sha256；文件不存在时返回"missing"
+    """
+    if not os.path.exists(path):
+        return "missing"
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_json(obj) -> str:
+    """
+    可JSON序列化对象的sha256
+    """
+    return hashlib.sha256(json.dumps(obj, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_json(path: str, default=None):
+    """
+    读取JSON文件；不存在或格式错误时返回default
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+# ---------------------------------------------------------------------------
+# 各步骤
+# ---------------------------------------------------------------------------
+
+def run_convert(book: dict) -> None:
+    """pdf或html转为markdown"""
+    source = book["source"]
+    if source.endswith(".pdf"):
+        from src.pdf2md import convert_pdf
+        convert_pdf(source, book["md"])
+    else:
+        from src.html_to_md import pandoc_convert
+        result = pandoc_convert(source, book["md"], force=True)
+        if result["status"] == "failed":
+            raise RuntimeError(result["error"])
+
+
+def run_clean(book: dict) -> None:
+    """整理markdown"""
+    clean_book(book["config"], book["name"])
+
+
+SPLIT_METHODS = {
+    "title_length_context": lambda text, p: split_markdown_by_title_and_length_with_context(
+        text, levels=p.get("levels", [2]), cut_by=p.get("cut_by", 600),
+        context_policy=p.get("context_policy", "section"), context_chars=p.get("context_chars", 600),
+        context_neighbors=p.get("context_neighbors", 1)),
+    "title_length_merge": lambda text, p: split_markdown_by_title_and_length_and_merge(
+        text, levels=p.get("levels", [2]), threshold=p.get("threshold", 1000),
+        cut_by=p.get("cut_by", 800), min_length=p.get("min_length", 120)),
+    "title": lambda text, p: [{"target": x} for x in split_markdown_by_title(text, levels=p.get("levels", [2]))],
+    "length": lambda text, p: split_by_length(text, p.get("cut_by", 600)),
+}
+
+
+def split_by_length(text: str, cut_by: int=600) -> list[dict]:
+    """按长度切分；与下一片段不是隔空行衔接的记入joiner，见splitter.piece_joiners"""
+    pieces = cut_text_by_length(text, cut_by=cut_by)
+    segments = []
+    for piece, joiner in zip(pieces, piece_joiners(text, pieces)):
+        segments.append({"target": piece, **({"joiner": joiner} if joiner != "\n\n" else {})})
+    return segments
+
+
+def run_split(book: dict) -> None:
+    """切分为JSON，并写出供核对的md"""
+    params = book["split"]
+    method = params.get("method", "title_length_context")
+    if method not in SPLIT_METHODS:
+        raise ValueError(f"未知的切分方法: {method}")
+    with open(book["clean"], "r", encoding="utf-8") as f:
+        text_list = SPLIT_METHODS[method](f.read(), params)
+    if params.get("reference_dir"):
+        from src.reference_index import load_index, attach_references
+        index = load_index(params["reference_dir"], book["reference_index"])
+        attach_references(text_list, index, params.get("reference_k", 3), params.get("reference_budget", 800))
+    write_json_atomic(book["json"], text_list)
+    with open(f"{book['json']}.md", "w", encoding="utf-8") as f:
+        f.write("\n---\n".join([x["target"] for x in text_list]))
+
+
+def segment_key(segment: dict, params: dict) -> str:
+    """
+    片段指纹：片段内容（target、context、reference）加校对参数
+    """
+    content = {k: segment[k] for k in ("target", "context", "reference") if k in segment}
+    key = {"segment": content, "model": params.get("model", "deepseek-chat")}
+    # 全文模式不计入，已有的缓存仍然有效
+    if params.get("mode", "full") != "full":
+        key["mode"] = params["mode"]
+    if params.get("cascade_model"):
+        key["cascade_model"] = params["cascade_model"]
+    return hash_json(key)
+
+
+def run_proofread(book: dict) -> None:
+    """
+    校对；先用片段缓存填充内容未变的片段，只校对其余片段
+    """
+    params = book["proofread"]
+    segments = read_json(book["json"], [])
+    keys = [segment_key(s, params) for s in segments]
+    cache = read_json(book["segments"], {})
+
+    # 上次（可能中断的）校对结果按其片段指纹并入缓存
+    previous_keys = read_json(book["keys"], [])
+    previous_output = read_json(book["proofread_json"], [])
+    if isinstance(previous_output, list) and len(previous_output) == len(previous_keys):
+        cache.update({k: p for k, p in zip(previous_keys, previous_output) if p is not None})
+
+    write_json_atomic(book["proofread_json"], [cache.get(k) for k in keys])
+    write_json_atomic(book["keys"], keys, indent=None)
+
+    # 分级校对的快速结果按片段内容保存：只保留当前片段的，其余（重新切分后已不存在的）删去
+    fast_path = f"{book['proofread_json']}.fast.json"
+    if params.get("cascade_model"):
+        fast_keys = {fast_result_key(s, params.get("model", "deepseek-chat"), params.get("mode", "full")) for s in segments}
+        fast = read_json(fast_path, {})
+        if isinstance(fast, dict):
+            write_json_atomic(fast_path, {k: v for k, v in fast.items() if k in fast_keys}, indent=None)
+        else:
+            os.remove(fast_path)
+    elif os.path.exists(fast_path):
+        os.remove(fast_path)
+
+    asyncio.run(process_paragraphs_async(
+        book["json"], book["proofread_json"], start_count=1,
+        model=params.get("model", "deepseek-chat"),
+        rpm=params.get("rpm", 15),
+        max_concurrent=params.get("max_concurrent", 3),
+        priority=params.get("priority"),
+        chapter=params.get("chapter"),
+        deadline=params.get("deadline"),
+        mode=params.get("mode", "full"),
+        hedge_budget=params.get("hedge_budget", 0.0),
+        hedge_model=params.get("hedge_model"),
+        cascade_model=params.get("cascade_model"),
+    ))
+
+    output = read_json(book["proofread_json"], [])
+    cache.update({k: p for k, p in zip(keys, output) if p is not None})
+    write_json_atomic(book["segments"], cache, indent=None)
+
+
+def proofread_complete(book: dict) -> bool:
+    """校对结果中没有未完成的片段"""
+    output = read_json(book["proofread_json"])
+    return isinstance(output, list) and all(p is not None for p in output)
+
+
+def run_diff(book: dict) -> None:
+    """生成jsdiff比较文件"""
+    from src.diff_tools import jsdiff_md_text
+    jsdiff_md_text(book["root"], os.path.basename(book["clean"]),
+                   os.path.basename(book["proofread_md"]), diff_path=book["diff"])
+
+
+def make_book(config: dict, name: str) -> dict:
+    """
+    一本书的文件路径与参数
+    """
+    root = config.get("root_path", ".")
+    ctx = make_book_context(config, name)
+    source = next((os.path.join(root, f"{name}.{ext}") for ext in ("pdf", "html")
+                   if os.path.exists(os.path.join(root, f"{name}.{ext}"))), None)
+    return {
+        "name": name,
+        "root": root,
+        "config": config,
+        "clean_params": {k: v for k, v in ctx.items() if k not in ("input", "output", "toc", *PIPELINE_KEYS)},
+        "source": source,
+        "md": ctx["input"],
+        "toc": ctx["toc"],
+        "clean": ctx["output"],
+        "json": os.path.join(root, f"{name}.clean.json"),
+        "proofread_json": os.path.join(root, f"{name}.clean.proofread.json"),
+        "proofread_md": os.path.join(root, f"{name}.clean.proofread.json.md"),
+        "diff": os.path.join(root, f"{name}.diff.html"),
+        "split": config.get("split", {}),
+        "proofread": config.get("proofread", {}),
+        "state": os.path.join(root, STATE_DIR, f"{name}.json"),
+        "segments": os.path.join(root, STATE_DIR, f"{name}.segments.json"),
+        "keys": os.path.join(root, STATE_DIR, f"{name}.keys.json"),
+        "reference_index": os.path.join(root, STATE_DIR, "reference.index.json.gz"),
+    }
+
+
+def book_steps(book: dict) -> dict[str, dict]:
+    """
+    一本书的步骤图：{步骤名: {'deps', 'inputs', 'params', 'outputs', 'run', 'complete'}}
+    """
+    steps = {}
+    if book["source"]:
+        steps["convert"] = {"deps": [], "inputs": [book["source"]], "params": {},
+                            "outputs": [book["md"]], "run": run_convert}
+    steps["clean"] = {"deps": ["convert"] if "convert" in steps else [],
+                      "inputs": [book["md"], book["toc"]], "params": book["clean_params"],
+                      "outputs": [book["clean"]], "run": run_clean}
+    # 参考资料文件也是切分步骤的输入
+    reference_files = []
+    if book["split"].get("reference_dir"):
+        from src.reference_index import source_files
+        reference_dir = book["split"]["reference_dir"]
+        reference_files = [os.path.join(reference_dir, f) for f in source_files(reference_dir)]
+    steps["split"] = {"deps": ["clean"], "inputs": [book["clean"], *reference_files], "params": book["split"],
+                      "outputs": [book["json"]], "run": run_split}
+    steps["proofread"] = {"deps": ["split"], "inputs": [book["json"]], "params": book["proofread"],
+                          "outputs": [book["proofread_json"], book["proofread_md"]],
+                          "run": run_proofread, "complete": proofread_complete}
+    steps["diff"] = {"deps": ["proofread"], "inputs": [book["clean"], book["proofread_md"]], "params": {},
+                     "outputs": [book["diff"]], "run": run_diff}
+    return steps
+
+
+def topological_order(steps: dict[str, dict]) -> list[str]:
+    """
+    按依赖关系排序步骤；有环时抛出ValueError
+    """
+    order = []
+    state = {}
+
+    def visit(name):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"步骤之间存在循环依赖: {name}")
+        state[name] = "visiting"
+        for dep in steps[name]["deps"]:
+            if dep in steps:
+                visit(dep)
+        state[name] = "done"
+        order.append(name)
+
+    for name in steps:
+        visit(name)
+    return order
+
+
+def run_book(config: dict, name: str) -> dict:
+    """
+    处理一本书：按依赖顺序执行需要重跑的步骤
+
+    Returns:
+        dict: {'name', 'steps': [{'step', 'status': 'done'|'cached'|'skipped'|'failed', 'seconds', 'error'}]}
+    """
+    book = make_book(config, name)
+    steps = book_steps(book)
+    wanted = set(config.get("steps", DEFAULT_STEPS))
+    state = read_json(book["state"], {})
+    records = []
+    failed = set()
+
+    for step_name in topological_order(steps):
+        if step_name not in wanted:
+            continue
+        step = steps[step_name]
+        record = {"step": step_name, "status": "cached", "seconds": 0.0, "error": ""}
+        records.append(record)
+
+        if any(dep in failed for dep in step["deps"]):
+            record["status"] = "skipped"
+            failed.add(step_name)
+            continue
+
+        fingerprint = hash_json({"inputs": [hash_file(p) for p in step["inputs"]], "params": step["params"]})
+        complete = step.get("complete", lambda b: True)
+        if (state.get(step_name) == fingerprint
+                and all(os.path.exists(p) for p in step["outputs"])
+                and complete(book)):
+            continue
+
+        start_time = time.perf_counter()
+        try:
+            step["run"](book)
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+            failed.add(step_name)
+            continue
+        finally:
+            record["seconds"] = time.perf_counter() - start_time
+
+        if complete(book):
+            record["status"] = "done"
+            state[step_name] = fingerprint
+            write_json_atomic(book["state"], state)
+        else:
+            # 未完成（如部分片段校对失败）：不记录指纹，下次继续，下游暂不执行
+            record["status"] = "failed"
+            record["error"] = "未全部完成"
+            failed.add(step_name)
+
+    return {"name": name, "steps": records}
+
+
+def prepare_reference_index(config: dict, book_names: list[str]) -> None:
+    """
+    各书共用参考资料索引：并行处理前先在主进程中建好（或确认已是最新），
+    以免几个进程同时重建、写同一个索引文件
+    """
+    reference_dir = config.get("split", {}).get("reference_dir")
+    if not reference_dir or "split" not in config.get("steps", DEFAULT_STEPS) or not book_names:
+        return
+    from src.reference_index import load_index
+    load_index(reference_dir, make_book(config, book_names[0])["reference_index"])
+
+
+def run_books(config: dict, book_names: list[str]|None=None, max_workers: int|None=None) -> list[dict]:
+    """
+    多进程并行处理多本书，结果按book_names的顺序返回
+
+    注意：每本书各自限速，总请求频率为rpm乘以并行书数
+    """
+    if book_names is None:
+        book_names = list(config.get("books", {}))
+    max_workers = max_workers or config.get("jobs", 1)
+    if max_workers <= 1:
+        return [run_book(config, name) for name in book_names]
+    prepare_reference_index(config, book_names)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_book, config, name) for name in book_names]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+
+    CONFIG_PATH = sys.argv[1] if len(sys.argv) > 1 else "src/clean_config.json"
+
+    for result in run_books(load_clean_config(CONFIG_PATH)):
+        print(f"\n【{result['name']}】")
+        print(f"步骤\t\t状态\t用时\n{'-'*40}")
+        for r in result["steps"]:
+            print(f"{r['step']:<16}{r['status']}\t{r['seconds']:.2f}s{'  ' + r['error'] if r['error'] else ''}")
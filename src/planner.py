@@ -0,0 +1,246 @@
+"""
+校对前的预估：token数、费用和用时
+
+1. 逐片段估算输入token（系统提示 + 参考资料 + 上下文 + 目标文本）和输出token；
+2. 按telemetry.PRICES估算费用（系统提示按缓存命中计）；
+3. 按以前的请求记录（`*.requests.jsonl`）拟合“用时 = 首token延迟 + 每token用时 × 输出token数”，
+   没有记录时用默认值；再按rpm、tpm和并发数模拟调度，估算总用时；
+4. 标出超过上下文或输出上限、或预计超过请求时限的片段。
+
+内容相同的片段只计一次（同process_paragraphs_async的coalesce）。
+
+用法（在项目根目录）：
+    python -m src.planner 切分好的JSON [--model deepseek-chat] [--mode full] [--rpm 15] [--tpm 0]
+        [--concurrency 3] [--history 以前的requests.jsonl ...] [--deadline 秒]
+"""
+import os
+import sys
+import json
+import heapq
+import argparse
+
+from src.splitter import estimate_tokens
+from src.telemetry import estimate_cost
+from src.proofreader import get_system_prompt, tag_paragraph, coalesce_key, request_timeout
+
+# 没有请求记录时的默认值：首token延迟（秒）、每个输出token的用时（秒）
+DEFAULT_TTFT = 2.0
+DEFAULT_SECONDS_PER_TOKEN = 0.03
+# 修改清单模式的输出token约为目标文本的此比例
+EDITS_OUTPUT_RATIO = 0.2
+# 拟合用时至少需要的记录数
+MIN_HISTORY = 5
+# 模型的上下文长度、输出上限（token）
+MODEL_LIMITS = {
+    "deepseek-chat": (65536, 8192),
+    "deepseek-reasoner": (65536, 8192),
+    "deepseek-v3": (65536, 8192),
+    "deepseek-r1": (65536, 8192),
+}
+DEFAULT_LIMITS = (65536, 8192)
+
+
+def read_history(paths: list[str], model: str|None=None) -> list[dict]:
+    """
+    读取以前成功的请求记录；有该模型的记录时只用该模型的
+
+    切分重试（resplit）、对冲（hedged）的记录，用时与累加的token数不对应，不用于拟合
+    """
+    records = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if (record.get("status") == "ok" and record.get("latency") and record.get("completion_tokens")
+                        and not record.get("resplit") and not record.get("hedged")):
+                    records.append(record)
+    same_model = [r for r in records if r.get("model") == model]
+    return same_model or records
+
+
+def fit_latency(records: list[dict]) -> tuple[float, float]:
+    """
+    最小二乘拟合：用时 = 首token延迟 + 每token用时 × 输出token数；记录不够时返回默认值
+    """
+    if len(records) < MIN_HISTORY:
+        return DEFAULT_TTFT, DEFAULT_SECONDS_PER_TOKEN
+    xs = [r["completion_tokens"] for r in records]
+    ys = [r["latency"] for r in records]
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        # 输出token数都相同，无法区分首token延迟和每token用时，全部算作每token用时
+        return 0.0, mean_y / mean_x
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    slope = max(slope, 0.0)
+    return max(mean_y - slope * mean_x, 0.0), slope
+
+
+def output_ratio(records: list[dict], mode: str="full") -> float|None:
+    """
+    以前的记录中，输出token数与目标文本字数之比；没有记录时返回None（按估算）
+    """
+    usable = [r for r in records if r.get("length") and r.get("mode", "full") == mode and not r.get("resplit")]
+    if len(usable) < MIN_HISTORY:
+        return None
+    return sum(r["completion_tokens"] for r in usable) / sum(r["length"] for r in usable)
+
+
+def estimate_segments(segments: list[dict], model: str="deepseek-chat", mode: str="full",
+                      ratio: float|None=None, ttft: float=DEFAULT_TTFT,
+                      seconds_per_token: float=DEFAULT_SECONDS_PER_TOKEN) -> list[dict]:
+    """
+    逐片段估算：prompt_tokens、completion_tokens、latency、cost、flags；与前面片段重复的duplicate为True
+    """
+    system_tokens = estimate_tokens(get_system_prompt(mode))
+    max_prompt, max_output = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+    seen = set()
+    rows = []
+    for i, segment in enumerate(segments):
+        pre_text, post_text = tag_paragraph(segment)
+        target = segment["target"]
+        prompt_tokens = system_tokens + estimate_tokens(pre_text) + estimate_tokens(post_text)
+        if ratio is not None:
+            completion_tokens = int(len(target) * ratio) + 1
+        elif mode == "edits":
+            completion_tokens = int(estimate_tokens(target) * EDITS_OUTPUT_RATIO) + 1
+        else:
+            completion_tokens = estimate_tokens(post_text)
+        latency = ttft + seconds_per_token * completion_tokens
+
+        flags = []
+        if prompt_tokens > max_prompt:
+            flags.append(f"输入超过上下文长度 {max_prompt}")
+        if completion_tokens > max_output:
+            flags.append(f"输出超过上限 {max_output}")
+        if latency > request_timeout(target):
+            flags.append(f"预计用时超过请求时限 {request_timeout(target):.0f}s")
+
+        key = coalesce_key(segment)
+        rows.append({
+            "index": i + 1,
+            "length": len(target),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": latency,
+            # 系统提示是各请求共同的前缀，按缓存命中计
+            "cost": estimate_cost(model, prompt_tokens, completion_tokens, system_tokens),
+            "flags": flags,
+            "duplicate": key in seen,
+        })
+        seen.add(key)
+    return rows
+
+
+def simulate_wall_time(rows: list[dict], concurrency: int=3, rpm: int=15, tpm: int|None=None) -> float:
+    """
+    模拟调度：concurrency个工作者按顺序取片段，请求间隔不小于60/rpm秒；
+    设置tpm时，未消化的token不超过一分钟的额度
+    """
+    workers = [0.0] * max(concurrency, 1)
+    interval = 60 / rpm if rpm else 0.0
+    next_slot = 0.0
+    token_clock = 0.0
+    finish = 0.0
+    for row in rows:
+        if row["duplicate"]:
+            continue
+        start = max(heapq.heappop(workers), next_slot)
+        tokens = row["prompt_tokens"] + row["completion_tokens"]
+        if tpm:
+            start = max(start, token_clock - 60)
+            token_clock = max(token_clock, start) + tokens * 60 / tpm
+        next_slot = start + interval
+        end = start + row["latency"]
+        heapq.heappush(workers, end)
+        finish = max(finish, end)
+    return finish
+
+
+def plan(segments: list[dict], model: str="deepseek-chat", mode: str="full", rpm: int=15, tpm: int|None=None,
+         concurrency: int=3, history: list[str]|None=None) -> dict:
+    """
+    估算一本书：各片段的估算（rows）及合计
+    """
+    records = read_history(history or [], model)
+    ttft, seconds_per_token = fit_latency(records)
+    ratio = output_ratio(records, mode)
+    rows = estimate_segments(segments, model, mode, ratio, ttft, seconds_per_token)
+    unique = [r for r in rows if not r["duplicate"]]
+    costs = [r["cost"] for r in unique if r["cost"] is not None]
+    return {
+        "rows": rows,
+        "segments": len(rows),
+        "requests": len(unique),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in unique),
+        "completion_tokens": sum(r["completion_tokens"] for r in unique),
+        "cost": sum(costs) if costs else None,
+        "wall_time": simulate_wall_time(rows, concurrency, rpm, tpm),
+        "history": len(records),
+        "ttft": ttft,
+        "seconds_per_token": seconds_per_token,
+        "flagged": [r for r in rows if r["flags"]],
+    }
+
+
+def format_plan(result: dict, deadline: float|None=None) -> str:
+    """
+    供打印的预估文本
+    """
+    cost_text = "-" if result["cost"] is None else f"{result['cost']:.2f} 元"
+    source = f"按 {result['history']} 条请求记录拟合" if result["history"] >= MIN_HISTORY else "默认值"
+    lines = [
+        f"片段数: {result['segments']}，请求数（去掉重复）: {result['requests']}",
+        f"token 输入/输出（估算）: {result['prompt_tokens']} / {result['completion_tokens']}",
+        f"估算费用: {cost_text}",
+        f"用时模型: 首token {result['ttft']:.2f}s + {result['seconds_per_token']*1000:.1f}ms/token（{source}）",
+        f"预计总用时: {result['wall_time']:.0f}s（约 {result['wall_time']/60:.1f} 分钟）",
+    ]
+    if deadline:
+        if result["wall_time"] <= deadline:
+            lines.append(f"可在时限 {deadline:.0f}s 内完成")
+        else:
+            lines.append(f"超过时限 {deadline:.0f}s（约为 {result['wall_time'] / deadline:.1f} 倍），可提高rpm、tpm、并发数，或改用修改清单模式")
+    if result["flagged"]:
+        lines.append(f"\n需要注意的片段: {len(result['flagged'])}")
+        for row in result["flagged"]:
+            lines.append(f"No.{row['index']}\t{row['length']}字\t输入{row['prompt_tokens']}\t输出{row['completion_tokens']}\t{'；'.join(row['flags'])}")
+    return "\n".join(lines) + "\n"
+
+
+def default_history(json_in: str) -> list[str]:
+    """
+    与proofreading1.py的命名一致：`书名.json`的校对记录为`书名.proofread.json.requests.jsonl`
+    """
+    base = json_in[:-len(".json")] if json_in.endswith(".json") else json_in
+    return [f"{base}.proofread.json.requests.jsonl"]
+
+
+def main(argv: list[str]|None=None) -> dict:
+    parser = argparse.ArgumentParser(description="校对前预估token数、费用和用时")
+    parser.add_argument("json", help="切分好的JSON")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--mode", default="full", choices=["full", "edits"])
+    parser.add_argument("--rpm", type=int, default=15)
+    parser.add_argument("--tpm", type=int, default=0, help="每分钟token上限，0为不限")
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--history", nargs="*", default=None, help="以前的请求记录（*.requests.jsonl），默认为本书的记录")
+    parser.add_argument("--deadline", type=float, default=None, help="希望在多少秒内完成")
+    args = parser.parse_args(argv)
+
+    with open(args.json, "r", encoding="utf-8") as f:
+        segments = json.load(f)
+    history = args.history if args.history is not None else default_history(args.json)
+    result = plan(segments, args.model, args.mode, args.rpm, args.tpm or None, args.concurrency, history)
+    print(format_plan(result, args.deadline))
+    return result
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -6,25 +6,107 @@ api_processor.py
 import os
 import json
 import time
+import signal
+import hashlib
 import asyncio
-from typing import List, Callable
+import functools
+import threading
+from typing import List, Callable, TYPE_CHECKING
 from concurrent.futures import ThreadPoolExecutor
 
-from google import genai
-from google.genai import types
-from openai import OpenAI
-from dotenv import load_dotenv
+from src.telemetry import Telemetry, read_usage, percentile
+from src.splitter import estimate_tokens, split_long_text
+from src.key_pool import get_key_pool, error_status
 
-# 加载环境变量
-load_dotenv()
+# 各家SDK较重，首次调用时才导入，只用其中一家或只用辅助函数时不必全部加载
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from google import genai
+
+# 提示文件与本模块在同一文件夹，不依赖当前工作目录
+PROMPT_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt-proofreader-system.xml")
+# 修改清单模式的提示：模型只返回修改清单（JSON），不重复全文
+EDITS_PROMPT_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt-proofreader-edits.xml")
+PROMPT_FILES = {"full": PROMPT_FILE_PATH, "edits": EDITS_PROMPT_FILE_PATH}
+
+# 修改清单模式中，原文片段与目标文本的匹配相似度低于此值时，改用全文模式重新校对
+EDITS_MATCH_THRESHOLD = 90
+
+# 应答短于目标文本的此比例时，视为被截断
+SHORT_RESULT_RATIO = 0.5
+# 应答不完整的片段切小重试：短于此字数的不再切分；最多切分的层数
+MIN_RESPLIT_LENGTH = 200
+MAX_RESPLIT_DEPTH = 2
+# 切小后重试可能有效的原因（见incomplete_reason）；认证、配置错误、没有可用key等，切小也没用
+RESPLIT_REASONS = ("timeout", "length", "short")
+
+# 单次请求的时限：基础秒数 + 每个估算token的秒数（输出与目标文本大致等长）
+TIMEOUT_BASE = 30
+TIMEOUT_PER_TOKEN = 0.2
+# 对冲请求：本次运行中至少有这么多成功的请求后，才按其每token用时的p95判断落后；最短等待秒数
+HEDGE_MIN_SAMPLES = 5
+HEDGE_MIN_DELAY = 5
+
+
+@functools.lru_cache(maxsize=None)
+def get_system_prompt(mode: str="full") -> str:
+    """
+    读取（并缓存）系统提示
+
+    mode: "full"（输出校对后的全文）或"edits"（输出修改清单）
+    """
+    with open(PROMPT_FILES[mode], "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def __getattr__(name: str):
+    # 兼容原来的模块级常量SYSTEM_PROMPT，访问时才读取文件
+    if name == "SYSTEM_PROMPT":
+        return get_system_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def load_env() -> None:
+    """
+    加载环境变量（.env），只执行一次
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+# OpenAI兼容接口的模型：模型名 → (API key环境变量, 接口地址)
+# 若没有配置环境变量，请在.env中设置相应的API key；可配置多个key轮流使用，见key_pool
+# 阿里云百炼如何获取API Key：https://help.aliyun.com/zh/model-studio/developer-reference/get-api-key
+OPENAI_COMPATIBLE_MODELS = {
+    "deepseek-chat": ("DEEPSEEK_API_KEY", "https://api.deepseek.com"),
+    "deepseek-reasoner": ("DEEPSEEK_API_KEY", "https://api.deepseek.com"),
+    "deepseek-v3": ("ALIYPUN_API_KEY", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+    "deepseek-r1": ("ALIYPUN_API_KEY", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client(api_key_env: str, base_url: str, api_key: str|None=None, max_retries: int=2) -> "OpenAI":
+    """
+    创建（并复用）OpenAI兼容接口的客户端；api_key为None时读取环境变量api_key_env
+
+    max_retries: SDK内部的重试次数（SDK默认为2）
+    """
+    load_env()
+    from openai import OpenAI
+    return OpenAI(api_key=api_key or os.getenv(api_key_env), base_url=base_url, max_retries=max_retries)
+
+
+@functools.lru_cache(maxsize=None)
+def get_google_client(api_key: str|None=None) -> "genai.Client":
+    """
+    创建（并复用）Google客户端；api_key为None时读取环境变量GOOGLE_API_KEY
+    """
+    load_env()
+    from google import genai
+    return genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"),)
 
-# 读取上一层文件夹中的提示文件
-# parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-# prompt_file_path = os.path.join(parent_dir, "prompt-proofreader.md")
-PROMPT_FILE_PATH = "src/prompt-proofreader-system.xml"
-SYSTEM_PROMPT = ""
-with open(PROMPT_FILE_PATH, "r", encoding="utf-8") as file:
-    SYSTEM_PROMPT = file.read()
 
 class RateLimiter:
     """
@@ -45,35 +127,44 @@ class RateLimiter:
             self.last_call_time = time.time()
 
 
-def deepseek(content: str, reference: str="", model:str="deepseek-chat") -> str|None:
+def request_timeout(text: str) -> float:
+    """
+    按估算的token数计算单次请求的时限（秒）
+    """
+    return TIMEOUT_BASE + TIMEOUT_PER_TOKEN * estimate_tokens(text)
+
+
+def deepseek(content: str, reference: str="", model:str="deepseek-chat", stats: dict|None=None, mode: str="full",
+             timeout: float|None=None, cancel: threading.Event|None=None) -> str|None:
     """
     调用各家deepseek校对模型，返回校对后的文本
 
-    model: deepseek-chat
-           deepseek-v3
+    model: deepseek-chat, deepseek-reasoner（deepseek官方平台）
+           deepseek-v3, deepseek-r1（阿里云百炼）
+           其他在OPENAI_COMPATIBLE_MODELS中登记的模型
     context: 上下文(其中可能包含需要校对的文本)
+    stats: 传入字典时，写入本次调用的统计：retries、latency、ttft（秒）、
+           prompt_tokens、completion_tokens、cached_tokens、finish_reason
+    mode: "full"返回校对后的全文，"edits"返回修改清单（JSON文本），见get_system_prompt
+    timeout: 单次请求的时限（秒），默认按content的估算token数计算（见request_timeout），超时按出错重试
+    cancel: 设置后停止接收、不再重试，返回空字符串（对冲请求中落后的一方，见hedged_call_async）
     """
+    stats = {} if stats is None else stats
+    timeout = timeout or request_timeout(content)
 
-    client: OpenAI|None = None
-    if model == "deepseek-chat" or model == "deepseek-reasoner":
-        # 初始化deepseek客户端
-        client = OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url="https://api.deepseek.com")
-    elif model == "deepseek-v3":
-        # 初始化阿里云deepseek v3
-        client = OpenAI(
-            # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
-            # 如何获取API Key：https://help.aliyun.com/zh/model-studio/developer-reference/get-api-key
-            api_key=os.getenv("ALIYPUN_API_KEY"),
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
-    else:
+    if model not in OPENAI_COMPATIBLE_MODELS:
         print(f"模型名称错误：{model}")
+        stats["error"] = "unknown_model"
         return None
+    # deepseek官方平台或阿里云百炼；每次尝试从key池中选用余量最多的key
+    api_key_env, base_url = OPENAI_COMPATIBLE_MODELS[model]
+    key_pool = get_key_pool(api_key_env)
+    estimated_tokens = estimate_tokens(reference) + 2 * estimate_tokens(content)
 
     retry_count = 0
     result = ""
 
-    message= [{"role": "system", "content": SYSTEM_PROMPT}]
+    message= [{"role": "system", "content": get_system_prompt(mode)}]
     # 单独提交一轮reference可节省token但效果有待验证 TODO
     if reference:
         message.extend([{"role": "assistant", "content": ""},
@@ -83,90 +174,593 @@ def deepseek(content: str, reference: str="", model:str="deepseek-chat") -> str|
     # print(message)
 
     while retry_count < 3:
+        if cancel is not None and cancel.is_set():
+            break
+        # 所有key都在暂停中或已达上限时，在这里等待
+        api_key = key_pool.acquire(estimated_tokens, cancel)
+        if api_key is None:
+            if cancel is None or not cancel.is_set():
+                print(f"没有可用的 API key：{api_key_env}")
+                stats["error"] = "no_key"
+            break
+        # 有多个key时SDK不再重试，超额等错误立即交给key池换key
+        client = get_openai_client(api_key_env, base_url, api_key, 0 if len(key_pool.keys) > 1 else 2)
         try:
             print(f"正在调用 {model} API (尝试 {retry_count+1}/3)...")
+            start_time = time.time()
+            # 流式接收，以便记录首个token的时间；最后一块带用量统计
             response = client.chat.completions.create(
                 model=model,
                 messages=message, # type: ignore
                 temperature=1.3,
-                stream=False,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+                **({"response_format": {"type": "json_object"}} if mode == "edits" else {}),
             )
-            result = response.choices[0].message.content
+            pieces = []
+            for chunk in response:
+                # SDK的timeout只限制每次读取的间隔，整个请求的时限在这里检查
+                if cancel is not None and cancel.is_set():
+                    response.close()
+                    break
+                if time.time() - start_time > timeout:
+                    response.close()
+                    raise TimeoutError(f"超过请求时限 {timeout:.0f}s")
+                if chunk.usage:
+                    stats.update(read_usage(chunk.usage))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not pieces:
+                        stats["ttft"] = time.time() - start_time
+                    pieces.append(delta)
+                if chunk.choices[0].finish_reason:
+                    stats["finish_reason"] = chunk.choices[0].finish_reason
+            stats["latency"] = time.time() - start_time
+            stats["retries"] = retry_count
+            key_pool.release(api_key, (stats.get("prompt_tokens") or 0) + (stats.get("completion_tokens") or 0))
+            if cancel is not None and cancel.is_set():
+                break
+            result = "".join(pieces)
             if result:
+                stats.pop("error", None)
                 break
+            retry_count += 1
         except Exception as e:
             print(f"API调用出错: {str(e)}")
+            stats["error"] = describe_error(e)
+            # key认证失败或超出额度：不再另外等待，换key（或由acquire等到该key恢复）重试；
+            # 还有别的key可用时换key不计入重试次数
+            if key_pool.report_error(api_key, e):
+                if not key_pool.available():
+                    retry_count += 1
+                continue
             # 优化等待时间策略
             wait_time = 5 + retry_count * 3
             print(f"等待 {wait_time} 秒后重试...")
-            time.sleep(wait_time)
+            if cancel is not None:
+                cancel.wait(wait_time)
+            else:
+                time.sleep(wait_time)
             retry_count += 1
             continue
 
+    stats.setdefault("retries", retry_count)
+    if cancel is not None and cancel.is_set():
+        stats["cancelled"] = True
+        return ""
     result = result.replace("\n</target>", "").replace("<target>\n", "")
 
     return result
 
 
-async def deepseek_async(content: str, reference: str, model:str, rate_limiter: RateLimiter) -> str|None:
-    """
-    异步调用deepseek校对模型，返回校对后的文本
+async def run_in_thread(func: Callable, executor: ThreadPoolExecutor|None=None):
     """
-    await rate_limiter.wait()
+    在线程池中执行同步API调用
 
-    # 使用线程池执行同步API调用
+    executor为None时为本次调用新建线程池，调用结束后关闭；
+    传入共用的线程池时，取消等待会立即返回，不必等线程中的请求结束
+    """
     loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor() as executor:
-        result = await loop.run_in_executor(
-            executor,
-            lambda: deepseek(content, reference, model)
-        )
-    return result
+    if executor is not None:
+        return await loop.run_in_executor(executor, func)
+    with ThreadPoolExecutor() as own_executor:
+        return await loop.run_in_executor(own_executor, func)
 
-# 配置Google API
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"),)
 
-def chat_google(text: str) -> str|None:
+async def deepseek_async(content: str, reference: str, model:str, rate_limiter: RateLimiter|None, stats: dict|None=None,
+                         executor: ThreadPoolExecutor|None=None, mode: str="full", cancel: threading.Event|None=None) -> str|None:
+    """
+    异步调用deepseek校对模型，返回校对后的文本
+
+    rate_limiter为None时不再等待限速器（调用方已等待）
+    executor: 共用的线程池，见run_in_thread
+    cancel: 见deepseek
+    """
+    if rate_limiter is not None:
+        await rate_limiter.wait()
+
+    return await run_in_thread(lambda: deepseek(content, reference, model, stats, mode, cancel=cancel), executor)
+
+def chat_google(text: str, stats: dict|None=None, mode: str="full", timeout: float|None=None,
+                cancel: threading.Event|None=None) -> str|None:
     """
     调用google校对模型，返回校对后的文本
+
+    stats、mode、timeout: 同deepseek
+    cancel: 同deepseek，但只在两次尝试之间检查
+    出错时不抛出异常，原因记入stats["error"]，重试后仍失败时返回空结果
     """
+    from google.genai import types
+
+    stats = {} if stats is None else stats
+    timeout = timeout or request_timeout(text)
+    key_pool = get_key_pool("GOOGLE_API_KEY")
     retry_count = 0
     result = ""
     while retry_count < 3:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-001',
-            contents=text,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT,
-                # max_output_tokens=3,
-                temperature=1.3,
-            ),
-        )
+        if cancel is not None and cancel.is_set():
+            stats["cancelled"] = True
+            return ""
+        api_key = key_pool.acquire(2 * estimate_tokens(text), cancel)
+        if api_key is None:
+            if cancel is None or not cancel.is_set():
+                print("没有可用的 API key：GOOGLE_API_KEY")
+                stats["error"] = "no_key"
+            break
+        client = get_google_client(api_key)
+        start_time = time.time()
+        try:
+            response = client.models.generate_content(
+                model='gemini-2.0-flash-001',
+                contents=text,
+                config=types.GenerateContentConfig(
+                    system_instruction=get_system_prompt(mode),
+                    # max_output_tokens=3,
+                    temperature=1.3,
+                    response_mime_type="application/json" if mode == "edits" else None,
+                    http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+                ),
+            )
+        except Exception as e:
+            print(f"API调用出错: {str(e)}")
+            stats["error"] = describe_error(e)
+            # 同deepseek：换key（或等该key恢复）重试，还有别的key可用时不计入重试次数
+            if key_pool.report_error(api_key, e):
+                if not key_pool.available():
+                    retry_count += 1
+                continue
+            # 超时等其他错误：同deepseek，等待后重试，重试后仍失败时返回空结果，交给对冲、切分重试
+            wait_time = 5 + retry_count * 3
+            print(f"等待 {wait_time} 秒后重试...")
+            if cancel is not None:
+                cancel.wait(wait_time)
+            else:
+                time.sleep(wait_time)
+            retry_count += 1
+            continue
+        stats["latency"] = time.time() - start_time
+        stats["retries"] = retry_count
+        usage = response.usage_metadata
+        if usage:
+            stats.update({
+                "prompt_tokens": usage.prompt_token_count,
+                "completion_tokens": usage.candidates_token_count,
+                "cached_tokens": usage.cached_content_token_count or 0,
+            })
+        key_pool.release(api_key, (stats.get("prompt_tokens") or 0) + (stats.get("completion_tokens") or 0))
         result = response.text
         if result:
+            stats.pop("error", None)
             break
         retry_count += 1
         time.sleep(3)  # 减少等待时间
+    stats.setdefault("retries", retry_count)
+    if cancel is not None and cancel.is_set():
+        stats["cancelled"] = True
+        return ""
     return result
 
 
-async def chat_google_async(text: str, rate_limiter: RateLimiter) -> str|None:
+async def chat_google_async(text: str, rate_limiter: RateLimiter|None, stats: dict|None=None,
+                            executor: ThreadPoolExecutor|None=None, mode: str="full",
+                            cancel: threading.Event|None=None) -> str|None:
     """
     异步调用google校对模型，返回校对后的文本
     """
-    await rate_limiter.wait()
+    if rate_limiter is not None:
+        await rate_limiter.wait()
 
-    # 使用线程池执行同步API调用
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor() as executor:
-        result = await loop.run_in_executor(
-            executor,
-            lambda: chat_google(text)
-        )
+    return await run_in_thread(lambda: chat_google(text, stats, mode, cancel=cancel), executor)
+
+
+def tag_paragraph(paragraph: dict) -> tuple[str, str]:
+    """
+    给片段加标签，返回(前置文本, 目标文本)
+
+    前置文本包括参考资料和上下文（上下文与目标相同时不加），目标文本为`<target>`标签包裹的待校对文本
+    """
+    target_text = paragraph["target"]
+    reference_text = paragraph.get("reference", "")
+    context_text = paragraph.get("context", "")
+
+    pre_text = f"<reference>\n{reference_text}\n</reference>" if reference_text else ""
+    # 合并位置的优劣有待测试  TODO
+    if context_text and context_text.strip() != target_text.strip():
+        pre_text += f"\n<context>\n{context_text}\n</context>"
+    post_text = f"<target>\n{target_text}\n</target>"
+    return pre_text, post_text
+
+
+def model_provider(model: str) -> str|None:
+    """
+    模型所属的接口：deepseek（OpenAI兼容接口）、google；不支持的模型返回None
+    """
+    if model.startswith("deepseek") or model in OPENAI_COMPATIBLE_MODELS:
+        return "deepseek"
+    if model == "google":
+        return "google"
+    return None
+
+
+def parse_edits(response: str) -> list[dict]|None:
+    """
+    解析修改清单模式的应答，返回[{"original", "corrected", "reason"}, ...]；格式不对时返回None
+    """
+    text = response.strip()
+    # 去掉可能的代码块标记
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    edits = data.get("edits") if isinstance(data, dict) else data
+    if not isinstance(edits, list):
+        return None
+    if not all(isinstance(e, dict) and isinstance(e.get("original"), str) and e["original"]
+               and isinstance(e.get("corrected"), str) for e in edits):
+        return None
+    return edits
+
+
+def apply_edits(target: str, edits: list[dict], threshold: float=EDITS_MATCH_THRESHOLD) -> str|None:
+    """
+    把修改清单应用到目标文本；有原文片段匹配不上（相似度低于threshold）或相互重叠时返回None
+    """
+    if not edits:
+        return target
+    from src.match_similar_text import find_best_match_list, apply_replacements
+
+    replacement_info = find_best_match_list(target, [(e["original"], e["corrected"]) for e in edits])
+    if any(info["ratio"] < threshold for info in replacement_info):
+        return None
+    locations = sorted(info["location"] for info in replacement_info)
+    if any(end > next_start for (_, end), (next_start, _) in zip(locations, locations[1:])):
+        return None
+    return apply_replacements(target, replacement_info, threshold)
+
+
+async def call_model_async(model: str, pre_text: str, post_text: str, stats: dict|None=None,
+                           executor: ThreadPoolExecutor|None=None, mode: str="full",
+                           cancel: threading.Event|None=None) -> str|None:
+    """
+    按模型调用相应的接口（不等待限速器），返回校对后的文本
+
+    mode为"edits"时，模型返回修改清单，在本地应用到目标文本；
+    应答无法解析或原文片段匹配不上时，改用全文模式再调用一次（stats中fallback为True）。
+    修改清单记入stats的edit_list
+    cancel: 设置后放弃本次调用，见deepseek
+    """
+    stats = {} if stats is None else stats
+    provider = model_provider(model)
+    if provider is None:
+        print(f"不支持的模型: {model}")
+        stats["error"] = "unknown_model"
+        return None
+
+    async def call(call_mode: str, call_stats: dict) -> str|None:
+        if provider == "deepseek":
+            return await deepseek_async(post_text, pre_text, model, None, call_stats, executor, call_mode, cancel)
+        return await chat_google_async(pre_text+'\n'+post_text, None, call_stats, executor, call_mode, cancel)
+
+    if mode == "full":
+        return await call("full", stats)
+
+    stats["mode"] = mode
+    response = await call("edits", stats)
+    edits = parse_edits(response) if response else None
+    if edits is not None:
+        target_text = post_text.replace("<target>\n", "").replace("\n</target>", "")
+        result = apply_edits(target_text, edits)
+        stats["edit_list"] = edits
+        if result is not None:
+            return result
+
+    if cancel is not None and cancel.is_set():
+        return ""
+    # 回退到全文模式，token和用时累加
+    print("修改清单无法解析或匹配不上，改用全文模式")
+    full_stats = {}
+    result = await call("full", full_stats)
+    add_usage(stats, full_stats, ("prompt_tokens", "completion_tokens", "cached_tokens", "latency", "retries"))
+    stats["finish_reason"] = full_stats.get("finish_reason")
+    stats["fallback"] = True
     return result
 
 
-async def process_paragraphs_async(json_in: str, json_out: str, start_count: int|list[int]=1, stop_count: int|None=None, model: str="deepseek-chat", rpm: int=15, max_concurrent: int=3):
+async def hedged_call_async(model: str, pre_text: str, post_text: str, stats: dict, executor: ThreadPoolExecutor|None=None,
+                            mode: str="full", hedge_after: float|None=None, hedge_model: str|None=None,
+                            acquire_hedge: Callable|None=None) -> str|None:
+    """
+    对冲请求：超过hedge_after秒还没有结果时，再发一个相同的请求（可改用hedge_model），
+    先得到结果的一方胜出，另一方取消（停止接收、不再重试）
+
+    hedge_after为None时不对冲。acquire_hedge: 发出对冲请求前调用的协程函数，返回False时不发
+    （用于限制额外花费、等待限速器）。胜出一方的统计写入stats，另有hedged、hedge_won
+    """
+    calls = []
+
+    def launch(call_model: str) -> asyncio.Task:
+        call_stats = {}
+        cancel = threading.Event()
+        task = asyncio.ensure_future(call_model_async(call_model, pre_text, post_text, call_stats, executor, mode, cancel))
+        calls.append((task, call_stats, cancel))
+        return task
+
+    primary = launch(model)
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done or (acquire_hedge is not None and not await acquire_hedge()):
+            result = await primary
+            stats.update(calls[0][1])
+            return result
+
+        print(f"请求超过 {hedge_after:.1f}s 未完成，发出对冲请求{f'（{hedge_model}）' if hedge_model else ''}")
+        hedge = launch(hedge_model or model)
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # 出错的一方不算胜出（异常不抛出，另一方还可能成功）
+            winner = next((task for task in done if task.exception() is None and task.result()), None)
+        winner = winner or primary
+        task, call_stats, _ = next(call for call in calls if call[0] is winner)
+        stats.update(call_stats)
+        stats["hedged"] = True
+        stats["hedge_won"] = winner is hedge
+        if task.exception() is not None:
+            stats.setdefault("error", describe_error(task.exception()))
+            return None
+        return task.result()
+    finally:
+        # 落后的一方：通知线程停止接收，不再等它
+        for task, _, cancel in calls:
+            if not task.done():
+                cancel.set()
+                task.cancel()
+
+
+def coalesce_key(paragraph: dict) -> str:
+    """
+    片段的合并指纹：规范化的目标文本（去掉首尾空白和行尾空白）加前置文本（参考资料、上下文）
+    """
+    pre_text, _ = tag_paragraph(paragraph)
+    target = "\n".join(line.rstrip() for line in paragraph["target"].strip().splitlines())
+    return hashlib.sha1(f"{pre_text}\0{target}".encode("utf-8")).hexdigest()
+
+
+def fast_result_key(paragraph: dict, model: str, mode: str="full") -> str:
+    """
+    分级校对中快速模型结果的指纹：片段内容（见coalesce_key）加模型和输出模式
+    """
+    return hashlib.sha1(f"{coalesce_key(paragraph)}\0{model}\0{mode}".encode("utf-8")).hexdigest()
+
+
+def has_changes(target: str, result: str) -> bool:
+    """
+    校对结果与目标文本是否有不同（忽略空白）
+    """
+    return "".join(target.split()) != "".join(result.split())
+
+
+def join_results(paragraphs: List[dict], results: List[str|None]) -> str:
+    """
+    拼接各片段的校对结果（跳过None）：片段间按切分时记录的joiner衔接（句中切开的不另起一段，见splitter.piece_joiners），
+    没有joiner或中间有未完成的片段时隔一个空行
+    """
+    parts = []
+    previous = None
+    for k, result in enumerate(results):
+        if result is None:
+            continue
+        if previous is not None:
+            joiner = paragraphs[previous].get("joiner", "\n\n") if previous == k - 1 else "\n\n"
+            if joiner != "\n\n":
+                parts[-1] = parts[-1].rstrip()
+                result = result.lstrip()
+            parts.append(joiner)
+        parts.append(result)
+        previous = k
+    return "".join(parts)
+
+
+def add_usage(stats: dict, extra: dict, keys: tuple=("prompt_tokens", "completion_tokens", "cached_tokens", "retries")) -> None:
+    """
+    把另一次调用的统计（token数等）累加到stats
+    """
+    for key in keys:
+        if extra.get(key) is not None:
+            stats[key] = (stats.get(key) or 0) + extra[key]
+
+
+def describe_error(error: Exception) -> str|int:
+    """
+    记入stats["error"]的出错原因：超时为"timeout"，有HTTP状态码的为状态码，其他为异常类名
+    """
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    return error_status(error) or type(error).__name__
+
+
+def incomplete_reason(target: str, result: str|None, stats: dict) -> str|None:
+    """
+    判断应答是否不完整，返回原因（完整时返回None）：
+        "timeout": 重试后仍没有结果，最后一次是超时
+        "failed": 重试后仍没有结果（出错、没有可用key、模型名称错误或空应答；原因见stats["error"]）
+        "length": 输出达到长度上限（finish_reason为length）
+        "short": 明显短于目标文本（不到SHORT_RESULT_RATIO），多半被截断；短于MIN_RESPLIT_LENGTH的不判断
+    只有RESPLIT_REASONS中的原因才切小重试
+    """
+    if not result:
+        return "timeout" if stats.get("error") == "timeout" else "failed"
+    if stats.get("finish_reason") == "length":
+        return "length"
+    if len(target) >= MIN_RESPLIT_LENGTH and len(result.strip()) < len(target.strip()) * SHORT_RESULT_RATIO:
+        return "short"
+    return None
+
+
+def stitch_pieces(pieces: List[str], results: List[str]) -> str:
+    """
+    按原顺序拼接各块的校对结果；模型常去掉首尾的换行，各块首尾的空白按原文保留
+    """
+    stitched = []
+    for piece, result in zip(pieces, results):
+        body = piece.strip()
+        if not body:
+            stitched.append(piece)
+            continue
+        start = len(piece) - len(piece.lstrip())
+        end = len(piece.rstrip())
+        stitched.append(piece[:start] + result.strip() + piece[end:])
+    return "".join(stitched)
+
+
+async def proofread_resplit_async(paragraph: dict, model: str, rate_limiter: RateLimiter, stats: dict,
+                                  executor: ThreadPoolExecutor|None=None, mode: str="full", depth: int=1,
+                                  max_depth: int=MAX_RESPLIT_DEPTH) -> str|None:
+    """
+    把应答不完整的片段切小后重新校对，拼回一段
+
+    目标文本切为两半左右（split_long_text，各块连起来与原文相同），各块以原来的上下文
+    （没有时以整个目标文本）为上下文，并发校对；某块仍不完整时继续切分，最多max_depth层。
+    任一块失败时返回None。各块的token数累加到stats，stats["resplit"]为最后的块数
+    """
+    target = paragraph["target"]
+    half = len(target) // 2 + 1
+    pieces = split_long_text(target, half, cut_by=half)
+    context = paragraph.get("context") or target
+
+    async def proofread_piece(piece: str) -> tuple[str|None, int]:
+        if not piece.strip():
+            return piece, 1
+        sub_paragraph = {**paragraph, "target": piece, "context": context}
+        pre_text, post_text = tag_paragraph(sub_paragraph)
+        await rate_limiter.wait()
+        piece_stats = {}
+        result = await call_model_async(model, pre_text, post_text, piece_stats, executor, mode)
+        add_usage(stats, piece_stats)
+        reason = incomplete_reason(piece, result, piece_stats)
+        if reason is None:
+            return result, 1
+        if reason in RESPLIT_REASONS and depth < max_depth and len(piece) >= MIN_RESPLIT_LENGTH:
+            sub_stats = {}
+            result = await proofread_resplit_async(sub_paragraph, model, rate_limiter, sub_stats, executor, mode, depth + 1, max_depth)
+            add_usage(stats, sub_stats)
+            return result, sub_stats.get("resplit", 1)
+        print(f"切分后的片段仍不完整（{reason}）: {piece.strip()[:20]}...")
+        return None, 1
+
+    outcomes = await asyncio.gather(*(proofread_piece(piece) for piece in pieces))
+    stats["resplit"] = sum(count for _, count in outcomes)
+    if any(result is None for result, _ in outcomes):
+        return None
+    return stitch_pieces(pieces, [result for result, _ in outcomes])
+
+
+def write_json_atomic(path: str, obj, indent: int|None=2) -> None:
+    """
+    先写临时文件，落盘后再改名替换，中断或崩溃时不会留下半截文件
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+
+def chapter_indices(input_paragraphs: List[dict], chapter: str) -> set[int]:
+    """
+    标题中含有chapter的章节（到下一个同级或更高级标题为止）所包含的片段索引
+    """
+    indices = set()
+    chapter_level = None
+    for i, paragraph in enumerate(input_paragraphs):
+        for line in paragraph["target"].splitlines():
+            if not line.startswith("#"):
+                continue
+            level = len(line) - len(line.lstrip("#"))
+            if chapter in line:
+                chapter_level = level
+            elif chapter_level is not None and level <= chapter_level:
+                chapter_level = None
+        if chapter_level is not None:
+            indices.add(i)
+    return indices
+
+
+def read_failed_indices(telemetry_path: str) -> set[int]:
+    """
+    从以前的请求记录中读取失败过的片段索引（从0开始）
+    """
+    failed = set()
+    if not os.path.exists(telemetry_path):
+        return failed
+    with open(telemetry_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "failed" and record.get("index"):
+                failed.add(record["index"] - 1)
+    return failed
+
+
+def order_indices(indices: List[int], input_paragraphs: List[dict], priority: str|None=None,
+                  chapter: str|None=None, failed: set[int]|None=None) -> List[int]:
+    """
+    按优先级排列待处理的片段
+
+    priority:
+        None: 原顺序
+        "longest": 长的片段先处理，缩短最后的长尾
+        "chapter": 标题中含有chapter的章节先处理，其余按原顺序
+        "failed": 以前失败过的片段先处理，其余按原顺序
+    """
+    if priority is None:
+        return list(indices)
+    if priority == "longest":
+        return sorted(indices, key=lambda i: -len(input_paragraphs[i]["target"]))
+    if priority == "chapter":
+        if not chapter:
+            raise ValueError("priority为chapter时需要指定chapter")
+        first = chapter_indices(input_paragraphs, chapter)
+    elif priority == "failed":
+        first = failed or set()
+    else:
+        raise ValueError(f"不支持的优先级: {priority}")
+    return sorted(indices, key=lambda i: i not in first)
+
+
+async def process_paragraphs_async(json_in: str, json_out: str, start_count: int|list[int]=1, stop_count: int|None=None, model: str="deepseek-chat", rpm: int=15, max_concurrent: int=3, metrics_port: int|None=None,
+                                   priority: str|None=None, chapter: str|None=None, deadline: float|None=None, mode: str="full",
+                                   resplit_depth: int=MAX_RESPLIT_DEPTH, hedge_budget: float=0.0, hedge_model: str|None=None,
+                                   cascade_model: str|None=None, coalesce: bool=True):
     """
     异步处理文本段落，直接将结果存储到 JSON 文件中
 
@@ -178,6 +772,30 @@ async def process_paragraphs_async(json_in: str, json_out: str, start_count: int
         model (str): 使用的模型，默认为"deepseek-chat"
         rpm (int): 每分钟请求数，默认为30
         max_concurrent (int): 最大并发数，默认为3
+        metrics_port (int|None): 开启Prometheus文本端点（http://127.0.0.1:端口/metrics），默认不开启
+        priority (str|None): 处理顺序，"longest"、"chapter"或"failed"，见order_indices；默认按原顺序
+        chapter (str|None): priority为"chapter"时先处理的章节标题（或其中一部分）
+        deadline (float|None): 运行时限（秒），超过后不再发出新请求，已发出的照常完成
+        mode (str): "full"（模型输出校对后的全文）或"edits"（模型输出修改清单，在本地应用），见call_model_async
+        resplit_depth (int): 应答不完整（超时、达到输出上限、明显被截断）的片段切小重试的最大层数，0为不重试，
+            见proofread_resplit_async
+        hedge_budget (float): 对冲请求数占已发出请求数的比例上限（额外花费的上限），默认0为不对冲。
+            请求用时超过本次运行中同样长度的p95（每token用时的p95×估算token数）时，再发一个相同的请求，
+            先得到结果的胜出，见hedged_call_async
+        hedge_model (str|None): 对冲请求使用的模型（如另一家接口的同类模型），默认与model相同
+        cascade_model (str|None): 分级校对：先用model（快速模型）校对全部片段，有修改的片段再交给
+            cascade_model（如deepseek-reasoner），其结果为最终结果；快速模型的结果另存于
+            `json_out.fast.json`（按片段内容的指纹保存，见fast_result_key），再次运行时复用，
+            重新切分后内容未变的片段也能复用。默认不分级
+        coalesce (bool): 目标文本和提示都相同的片段（如多处引用的同一首诗）只请求一次，结果分给各处，
+            见coalesce_key；默认开启
+
+    每个请求的统计记录追加到`json_out.requests.jsonl`，汇总写入日志；
+    每完成一段，按已完成的字数和用时估算剩余时间
+
+    每完成一段即整体写入输出JSON（先写临时文件再改名）。收到SIGINT/SIGTERM（Ctrl-C）时
+    不再发出新请求，等进行中的请求完成后正常结束；再次收到时取消进行中的请求，
+    已完成的结果照样保存。输出JSON无法解析时报错退出，不会用空列表覆盖
     """
     # 读取输入 JSON 文件
     with open(json_in, "r", encoding="utf-8") as f:
@@ -191,24 +809,18 @@ async def process_paragraphs_async(json_in: str, json_out: str, start_count: int
         try:
             with open(json_out, "r", encoding="utf-8") as f:
                 output_paragraphs = json.load(f)
+        except json.JSONDecodeError as e:
+            # 其中可能有已完成（已付费）的结果，不能静默地重新开始
+            raise ValueError(f"输出 JSON 格式错误，请检查或移走后重试: {json_out}: {e}") from e
 
-            # 确保输出 JSON 的长度与输入 JSON 相同
-            if len(output_paragraphs) != input_paragraphs_length:
-                # 如果长度不同，中断处理
-                raise ValueError(f"输出 JSON 的长度与输入 JSON 的长度不同: {len(output_paragraphs)} != {input_paragraphs_length}")
-        except (json.JSONDecodeError, FileNotFoundError):
-            # 如果文件不存在或格式错误，创建新的输出列表
-            output_paragraphs = [None] * input_paragraphs_length
+        # 确保输出 JSON 的长度与输入 JSON 相同
+        if len(output_paragraphs) != input_paragraphs_length:
+            # 如果长度不同，中断处理
+            raise ValueError(f"输出 JSON 的长度与输入 JSON 的长度不同: {len(output_paragraphs)} != {input_paragraphs_length}")
     else:
-        # 创建与输入 JSON 长度相同的空列表
+        # 创建与输入 JSON 长度相同的空列表，并创建初始的输出 JSON 文件
         output_paragraphs = [None] * input_paragraphs_length
-
-        # 确保输出目录存在
-        os.makedirs(os.path.dirname(json_out), exist_ok=True)
-
-        # 创建初始的输出 JSON 文件
-        with open(json_out, "w", encoding="utf-8") as f:
-            json.dump(output_paragraphs, f, ensure_ascii=False, indent=2)
+        write_json_atomic(json_out, output_paragraphs)
 
     # 确定要处理的段落索引
     indices_to_process = []
@@ -228,6 +840,24 @@ async def process_paragraphs_async(json_in: str, json_out: str, start_count: int
             if 0 <= i < input_paragraphs_length and output_paragraphs[i] is None:
                 indices_to_process.append(i)
 
+    # 分级校对时快速模型的结果：片段指纹 → 结果（与片段顺序、数量无关）
+    fast_json_out = f"{json_out}.fast.json"
+    fast_outputs: dict[str, str] = {}
+    if cascade_model and os.path.exists(fast_json_out):
+        try:
+            with open(fast_json_out, "r", encoding="utf-8") as f:
+                fast_outputs = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"快速模型结果 JSON 格式错误，请检查或移走后重试: {fast_json_out}: {e}") from e
+        if not isinstance(fast_outputs, dict):
+            # 旧格式（按位置保存的列表）无法确定对应的片段，不再使用
+            fast_outputs = {}
+
+    # 按优先级排列
+    telemetry_path = f"{json_out}.requests.jsonl"
+    failed_before = read_failed_indices(telemetry_path) if priority == "failed" else None
+    indices_to_process = order_indices(indices_to_process, input_paragraphs, priority, chapter, failed_before)
+
     # 创建日志文件
     log_file_path = f"{json_out}.log"
     os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
@@ -236,121 +866,339 @@ async def process_paragraphs_async(json_in: str, json_out: str, start_count: int
         log_file.write(f"异步处理开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
         log_file.write(f"待处理段落数: {len(indices_to_process)}/{input_paragraphs_length}\n")
         log_file.write(f"最大并发数: {max_concurrent}\n")
+        if mode != "full":
+            log_file.write(f"输出模式: {mode}\n")
+        if priority:
+            log_file.write(f"优先级: {priority}{f'（{chapter}）' if priority == 'chapter' else ''}\n")
+        if deadline:
+            log_file.write(f"运行时限: {deadline}s\n")
+        if cascade_model:
+            log_file.write(f"分级校对: {model} → {cascade_model}\n")
+        if hedge_budget > 0:
+            log_file.write(f"对冲请求上限: {hedge_budget:.0%}{f'（{hedge_model}）' if hedge_model else ''}\n")
         log_file.write(f"{'='*50}\n\n")
 
-    # 创建限速器和信号量
+    # 创建限速器
     rate_limiter = RateLimiter(rpm)
-    semaphore = asyncio.Semaphore(max_concurrent)
 
     # 创建文件锁，用于安全地更新 JSON 文件
     file_lock = asyncio.Lock()
 
-    # 定义异步处理任务
-    async def process_one(i):
-        async with semaphore:
-            target_text = input_paragraphs[i]["target"]
-            reference_text = input_paragraphs[i]["reference"] if "reference" in input_paragraphs[i] else ""
-            context_text = input_paragraphs[i]["context"] if "context" in input_paragraphs[i] else ""
-
-            # 判断是否需要添加上下文
-            is_with_context = context_text and context_text.strip() != target_text.strip()
-            print(f"处理 {i+1}/{input_paragraphs_length}{' with context' if is_with_context else ''}{' with reference' if reference_text else ''}:\n{target_text[:30]} ...\n")
-
-            # 加标签，合并
-            pre_text = f"<reference>\n{reference_text}\n</reference>" if reference_text else ""
-            # 合并位置的优劣有待测试  TODO
-            if is_with_context:
-                pre_text += f"\n<context>\n{context_text}\n</context>"
-            post_text = f"<target>\n{target_text}\n</target>"
+    # 请求统计
+    telemetry = Telemetry(telemetry_path)
+    if metrics_port:
+        telemetry.serve(metrics_port)
 
-            start_time = time.time()
+    # 进度：用于估算剩余时间和判断时限
+    run_start = time.time()
+    progress = {"done_length": 0, "remaining_length": sum(len(input_paragraphs[i]["target"]) for i in indices_to_process),
+                "skipped": 0, "stopping": False, "cancelled": False, "launched": 0, "hedged": 0, "escalated": 0, "coalesced": 0}
+    # 本次运行中成功请求的每token用时（秒），用于判断落后的请求
+    seconds_per_token: List[float] = []
+
+    def stop_launching() -> bool:
+        # 收到中断信号或超过时限后不再发出新请求
+        return progress["stopping"] or (deadline is not None and time.time() - run_start > deadline)
+
+    def hedge_delay(text: str) -> float|None:
+        # 同样长度的请求用时的p95；样本不够或不对冲时返回None
+        if hedge_budget <= 0 or len(seconds_per_token) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, percentile(seconds_per_token, 95) * estimate_tokens(text))
 
-            # 等待限速器
-            await rate_limiter.wait()
+    async def acquire_hedge() -> bool:
+        # 对冲请求不超过已发出请求数的hedge_budget，同样要等待限速器
+        if progress["hedged"] + 1 > hedge_budget * progress["launched"] or stop_launching():
+            return False
+        progress["hedged"] += 1
+        await rate_limiter.wait()
+        return True
 
-            # 调用相应的 API
-            processed_text = None
-            if model.startswith("deepseek"):
-                processed_text = await deepseek_async(post_text, pre_text, model, rate_limiter)
-            elif model == "google":
-                processed_text = await chat_google_async(pre_text+'\n'+post_text, rate_limiter)
+    def eta_text() -> str:
+        elapsed_total = time.time() - run_start
+        if not progress["done_length"] or elapsed_total <= 0:
+            return ""
+        speed = progress["done_length"] / elapsed_total
+        return f"，约 {speed:.1f} 字/s，预计剩余 {progress['remaining_length'] / speed:.0f}s"
+
+    # 合并重复片段：指纹 → (最先处理的片段索引, 其结果的future)；已有结果的片段预先填入
+    coalesce_keys = [coalesce_key(p) for p in input_paragraphs] if coalesce else []
+    inflight: dict[str, tuple[int, asyncio.Future]] = {}
+    if coalesce:
+        for j, output in enumerate(output_paragraphs):
+            if output is not None and coalesce_keys[j] not in inflight:
+                done_future = asyncio.get_running_loop().create_future()
+                done_future.set_result(output)
+                inflight[coalesce_keys[j]] = (j, done_future)
+
+    async def process_one(i, enqueue_time):
+        if not coalesce:
+            return await proofread_one(i, enqueue_time)
+        key = coalesce_keys[i]
+        if key not in inflight:
+            inflight[key] = (i, asyncio.get_running_loop().create_future())
+            try:
+                await proofread_one(i, enqueue_time)
+            finally:
+                # 失败或未处理时为None，相同的片段随之跳过
+                inflight[key][1].set_result(output_paragraphs[i])
+            return
+
+        # 与已请求的片段相同：不占用工作者，它有结果时（回调中）分给本段
+        owner, shared = inflight[key]
+        progress["coalesced"] += 1
+        if shared.done():
+            share_result(i, owner, shared.result())
+        else:
+            shared.add_done_callback(lambda future: share_result(i, owner, future.result()))
+
+    def share_result(i, owner, result):
+        # 把相同片段的结果分给本段（首尾空白按本段原文）；同步执行，不与其他协程交错
+        target_text = input_paragraphs[i]["target"]
+        if result is None:
+            progress["remaining_length"] -= len(target_text)
+            if stop_launching():
+                progress["skipped"] += 1
             else:
-                print(f"不支持的模型: {model}")
+                print(f"段落 {i+1}/{input_paragraphs_length}: 与段落 {owner+1} 相同，后者处理失败，跳过\n{'-'*40}\n")
+            return
+        output_paragraphs[i] = stitch_pieces([target_text], [result])
+        write_json_atomic(json_out, output_paragraphs)
+        progress["done_length"] += len(target_text)
+        progress["remaining_length"] -= len(target_text)
+        print(f"完成 {i+1}/{input_paragraphs_length}（与段落 {owner+1} 相同，复用结果）{eta_text()}\n{'-'*40}\n")
+        with open(log_file_path, "a", encoding="utf-8") as log_file:
+            log_file.write(f"完成 {i+1}/{input_paragraphs_length}（与段落 {owner+1} 相同，复用结果）\n")
+
+    # 定义异步处理任务
+    async def proofread_one(i, enqueue_time):
+        queue_wait = time.time() - enqueue_time
+        target_text = input_paragraphs[i]["target"]
+        if stop_launching():
+            progress["skipped"] += 1
+            return
+
+        # 加标签，合并
+        pre_text, post_text = tag_paragraph(input_paragraphs[i])
+        print(f"处理 {i+1}/{input_paragraphs_length}{' with context' if '<context>' in pre_text else ''}{' with reference' if '<reference>' in pre_text else ''}:\n{target_text[:30]} ...\n")
+
+        start_time = time.time()
+
+        # 等待限速器
+        await rate_limiter.wait()
+        rate_limit_wait = time.time() - start_time
+
+        # 超过时限或收到中断信号，不再发出新请求
+        if stop_launching():
+            progress["skipped"] += 1
+            return
+
+        # 调用相应的 API
+        for call_model in (model, cascade_model):
+            if call_model and model_provider(call_model) is None:
+                print(f"不支持的模型: {call_model}")
                 return
 
-            end_time = time.time()
-            elapsed = end_time - start_time
-
-            if processed_text:
-                # 如果成功获取结果，更新输出 JSON
-                async with file_lock:
-                    try:
-                        # 重新读取 JSON 文件，以防其他任务已经更新了它
-                        with open(json_out, "r", encoding="utf-8") as f:
-                            current_output = json.load(f)
-
-                        # 更新当前段落的处理结果
-                        current_output[i] = processed_text
-
-                        # 保存更新后的 JSON
-                        with open(json_out, "w", encoding="utf-8") as f:
-                            json.dump(current_output, f, ensure_ascii=False, indent=2)
-                    except (FileNotFoundError, json.JSONDecodeError) as e:
-                        print(f"更新 JSON 文件时出错: {str(e)}")
-                        # 如果文件不存在或格式错误，重新创建
-                        current_output: List[str|None] = [None] * input_paragraphs_length
-                        current_output[i] = processed_text
-                        with open(json_out, "w", encoding="utf-8") as f:
-                            json.dump(current_output, f, ensure_ascii=False, indent=2)
-
-                print(f"完成 {i+1}/{input_paragraphs_length} 长度 {len(target_text)} 用时 {elapsed:.2f}s\n{'-'*40}\n")
-
-                # 记录日志
-                async with file_lock:
-                    with open(log_file_path, "a", encoding="utf-8") as log_file:
-                        log_file.write(f"完成 {i+1}/{input_paragraphs_length} 长度 {len(target_text)} 用时 {elapsed:.2f}s\n")
+        async def run_model(call_model: str, stage: str|None=None) -> str|None:
+            # 调用一个模型，应答不完整时切分重试，并记录请求统计
+            stats = {} if stage is None else {"stage": stage}
+            limiter_wait = rate_limit_wait
+            if stage == "slow":
+                wait_start = time.time()
+                await rate_limiter.wait()
+                limiter_wait = time.time() - wait_start
+                processed = await hedged_call_async(call_model, pre_text, post_text, stats, executor, mode)
             else:
-                print(f"段落 {i+1}/{input_paragraphs_length}: 处理失败，跳过\n{'-'*40}\n")
+                progress["launched"] += 1
+                processed = await hedged_call_async(call_model, pre_text, post_text, stats, executor, mode,
+                                                    hedge_delay(target_text), hedge_model, acquire_hedge)
+
+            # 超时、达到输出上限或明显被截断的长片段，切小后重新校对，拼回原位
+            reason = incomplete_reason(target_text, processed, stats)
+            if reason in RESPLIT_REASONS and resplit_depth and len(target_text) >= MIN_RESPLIT_LENGTH and not stop_launching():
+                print(f"段落 {i+1}/{input_paragraphs_length} 应答不完整（{reason}），切分后重新校对")
+                stats["incomplete"] = reason
+                processed = await proofread_resplit_async(input_paragraphs[i], call_model, rate_limiter, stats,
+                                                          executor, mode, max_depth=resplit_depth)
+            elif reason in ("length", "short"):
+                # 不能再切分的片段，不保存截断的结果
+                stats["incomplete"] = reason
+                processed = None
+            elif reason is None and stage != "slow" and not stats.get("fallback") and stats.get("latency"):
+                seconds_per_token.append(stats["latency"] / estimate_tokens(target_text))
+
+            telemetry.record(
+                index=i+1,
+                provider=model_provider(call_model),
+                model=call_model,
+                status="ok" if processed else "failed",
+                queue_wait=queue_wait,
+                rate_limit_wait=limiter_wait,
+                length=len(target_text),
+                **stats,
+            )
+            return processed
+
+        if not cascade_model:
+            processed_text = await run_model(model)
+        else:
+            # 分级校对：先用快速模型，有修改的片段再交给cascade_model；以前的快速结果直接复用
+            fast_key = fast_result_key(input_paragraphs[i], model, mode)
+            processed_text = fast_outputs.get(fast_key)
+            if processed_text is not None:
+                # 可能是内容相同、首尾空白不同的另一片段的结果，首尾空白按本段原文
+                processed_text = stitch_pieces([target_text], [processed_text])
+            else:
+                processed_text = await run_model(model, "fast")
+                if processed_text:
+                    fast_outputs[fast_key] = processed_text
+                    write_json_atomic(fast_json_out, fast_outputs, indent=None)
+            if processed_text and has_changes(target_text, processed_text):
+                if stop_launching():
+                    # 快速结果已保存，再次运行时直接交给cascade_model
+                    progress["skipped"] += 1
+                    return
+                progress["escalated"] += 1
+                processed_text = await run_model(cascade_model, "slow")
+
+        end_time = time.time()
+        elapsed = end_time - start_time
+
+        if processed_text:
+            # 如果成功获取结果，更新输出 JSON（内存中的列表是唯一的来源，整体原子写入）
+            output_paragraphs[i] = processed_text
+            write_json_atomic(json_out, output_paragraphs)
+
+            progress["done_length"] += len(target_text)
+            progress["remaining_length"] -= len(target_text)
+            print(f"完成 {i+1}/{input_paragraphs_length} 长度 {len(target_text)} 用时 {elapsed:.2f}s{eta_text()}\n{'-'*40}\n")
 
-                # 记录日志
-                async with file_lock:
-                    with open(log_file_path, "a", encoding="utf-8") as log_file:
-                        log_file.write(f"段落 {i+1}/{input_paragraphs_length}: 处理失败，跳过\n")
-                        log_file.write(f"原文: {target_text.strip().splitlines()[0][:20]}...\n{'-'*40}\n")
+            # 记录日志
+            async with file_lock:
+                with open(log_file_path, "a", encoding="utf-8") as log_file:
+                    log_file.write(f"完成 {i+1}/{input_paragraphs_length} 长度 {len(target_text)} 用时 {elapsed:.2f}s\n")
+        else:
+            progress["remaining_length"] -= len(target_text)
+            print(f"段落 {i+1}/{input_paragraphs_length}: 处理失败，跳过\n{'-'*40}\n")
+
+            # 记录日志
+            async with file_lock:
+                with open(log_file_path, "a", encoding="utf-8") as log_file:
+                    log_file.write(f"段落 {i+1}/{input_paragraphs_length}: 处理失败，跳过\n")
+                    log_file.write(f"原文: {target_text.strip().splitlines()[0][:20]}...\n{'-'*40}\n")
 
     # 如果没有需要处理的段落，直接返回
     if not indices_to_process:
         print("没有需要处理的段落")
+        telemetry.close()
         return output_paragraphs
 
-    # 创建所有任务
-    tasks = [process_one(i) for i in indices_to_process]
+    # 固定数量的工作者从有界队列中取片段，队列随取随补；
+    # 内存和事件循环的负担与书的长短无关
+    worker_count = min(max_concurrent, len(indices_to_process))
+    queue: asyncio.Queue[tuple[int, float]|None] = asyncio.Queue(maxsize=worker_count)
+    # 共用的线程池；取消时不必等线程中的请求结束。对冲请求需要额外的线程
+    executor = ThreadPoolExecutor(max_workers=worker_count * 2 if hedge_budget > 0 else worker_count)
+
+    async def feed():
+        for n, i in enumerate(indices_to_process):
+            # 超过时限或收到中断信号，其余片段不再入队
+            if stop_launching():
+                progress["skipped"] += len(indices_to_process) - n
+                break
+            await queue.put((i, time.time()))
+        for _ in range(worker_count):
+            await queue.put(None)
+
+    async def work():
+        while (item := await queue.get()) is not None:
+            await process_one(*item)
+
+    runner = asyncio.gather(feed(), *(work() for _ in range(worker_count)))
+
+    # 第一次收到信号：不再发出新请求，等进行中的请求完成；第二次：取消进行中的请求
+    def on_signal(signame: str):
+        if not progress["stopping"]:
+            progress["stopping"] = True
+            print(f"\n收到 {signame}，等待进行中的请求完成后退出；再次按 Ctrl-C 立即取消\n")
+        else:
+            print(f"\n再次收到 {signame}，取消进行中的请求\n")
+            progress["cancelled"] = True
+            runner.cancel()
 
-    # 等待所有任务完成
-    await asyncio.gather(*tasks)
+    loop = asyncio.get_running_loop()
+    handled_signals = []
+    for signame in ("SIGINT", "SIGTERM"):
+        sig = getattr(signal, signame, None)
+        if sig is None:
+            continue
+        try:
+            loop.add_signal_handler(sig, on_signal, signame)
+            handled_signals.append(sig)
+        except (NotImplementedError, RuntimeError):
+            # Windows或不在主线程时不支持，Ctrl-C照常取消整个任务
+            pass
+
+    try:
+        await runner
+    except asyncio.CancelledError:
+        print("处理被中断，已完成的段落已保存")
+        with open(log_file_path, "a", encoding="utf-8") as log_file:
+            log_file.write(f"\n处理被中断: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        # 由信号取消的，照常收尾后返回；由外部取消的，继续向上传递
+        if not progress["cancelled"]:
+            write_json_atomic(json_out, output_paragraphs)
+            with open(log_file_path, "a", encoding="utf-8") as log_file:
+                log_file.write(telemetry.format_summary())
+            telemetry.close()
+            raise
+    finally:
+        for sig in handled_signals:
+            loop.remove_signal_handler(sig)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # 最后再整体写入一次
+    write_json_atomic(json_out, output_paragraphs)
+    final_output = output_paragraphs
 
     # 记录处理完成信息
     with open(log_file_path, "a", encoding="utf-8") as log_file:
         log_file.write(f"\n{'='*50}\n")
         log_file.write(f"处理结束时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-
-        # 重新读取输出 JSON 以获取最新状态
-        with open(json_out, "r", encoding="utf-8") as f:
-            final_output = json.load(f)
+        if progress["skipped"]:
+            log_file.write(f"超过运行时限或收到中断信号，未发出请求的段落数: {progress['skipped']}\n")
+        if cascade_model:
+            log_file.write(f"分级校对: 有修改、交给 {cascade_model} 的段落数: {progress['escalated']}\n")
+        if coalesce:
+            log_file.write(f"重复片段复用结果: {progress['coalesced']}/{len(indices_to_process)}"
+                           f"（{progress['coalesced'] / len(indices_to_process):.1%}）\n")
 
         # 统计已处理和未处理的段落数
         processed_count = sum(1 for p in final_output if p is not None)
         processed_length = sum(len(p) for p in final_output if p is not None)
         log_file.write(f"已处理段落数、字数: {processed_count}/{input_paragraphs_length}, {processed_length}/{sum(len(p) for p in input_paragraphs)}\n")
         log_file.write(f"未处理段落数: {input_paragraphs_length - processed_count}/{input_paragraphs_length}\n")
+        log_file.write(telemetry.format_summary())
+        # 使用了多个API key时，记录各key的用量和状态
+        key_rows = get_key_pool(OPENAI_COMPATIBLE_MODELS[model][0] if model in OPENAI_COMPATIBLE_MODELS else "GOOGLE_API_KEY").status()
+        if len(key_rows) > 1:
+            for row in key_rows:
+                state = "停用" if row["disabled"] else "暂停" if row["quarantined"] else "正常"
+                log_file.write(f"API key {row['key']}: 请求 {row['requests']}，出错 {row['errors']}，{state}\n")
         log_file.write(f"{'='*50}\n\n")
 
+    if progress["skipped"]:
+        print(f"{progress['skipped']} 个段落未处理，可再次运行继续")
+    if progress["coalesced"]:
+        print(f"{progress['coalesced']} 个重复片段复用了相同片段的结果")
+    print(telemetry.format_summary())
+    telemetry.close()
+
     # 生成 Markdown 文件
     md_file_path = f"{json_out}.md"
     with open(md_file_path, "w", encoding="utf-8") as f:
         # 只包含已处理的段落
-        processed_paragraphs = [p for p in final_output if p is not None]
-        f.write("\n\n".join(processed_paragraphs))
+        f.write(join_results(input_paragraphs, final_output))
 
     return final_output
 
@@ -4,9 +4,156 @@
 ! pip install pymupdf4llm
 
 会丢失加框文字
+
+逐页提取，多进程并行；每页结果按（pdf内容哈希, 提取参数, 页码）缓存，
+调整参数或页码范围后重新运行，只提取缓存中没有的页；
+各页按顺序流式写入输出文件，大部头扫描书也不必把整本书放在内存里。
+
+用法：python pymupdf2md.py 1.pdf 2.pdf [--pages 1-20,35] [--workers 4] [--options '{"margins": 20}']
 """
-import pymupdf4llm
-md_text = pymupdf4llm.to_markdown("1.pdf")
+import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+CACHE_DIR = ".pymupdf_cache"
+
+# 每个工作进程中已打开的文档
+_DOCUMENTS = {}
+
+
+def file_hash(path: str, chunk_size: int=1 << 20) -> str:
+    """
+    文件内容的sha256，分块读取
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def options_hash(options: dict) -> str:
+    """
+    提取参数的哈希，参数不同则缓存不同
+    """
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_page_ranges(pages: str|None, page_count: int) -> list[int]:
+    """
+    解析页码范围（1起，如"1-20,35"），返回0起的页码列表；None表示全部
+    """
+    if not pages:
+        return list(range(page_count))
+    result = []
+    for part in pages.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, stop = part.split("-", 1)
+            first = int(start) if start else 1
+            last = int(stop) if stop else page_count
+        else:
+            first = last = int(part)
+        result.extend(p - 1 for p in range(first, last + 1) if 1 <= p <= page_count)
+    return sorted(set(result))
+
+
+def cache_path(cache_dir: str, pdf_hash: str, opt_hash: str, page: int) -> str:
+    """
+    一页的缓存文件
+    """
+    return os.path.join(cache_dir, pdf_hash, opt_hash, f"{page:05d}.md")
+
+
+def _open_document(pdf_path: str):
+    """
+    在当前进程中打开（并复用）文档；pymupdf按需读取页面，不载入整本书
+    """
+    if pdf_path not in _DOCUMENTS:
+        import pymupdf
+        _DOCUMENTS[pdf_path] = pymupdf.open(pdf_path)
+    return _DOCUMENTS[pdf_path]
+
+
+def extract_page(pdf_path: str, page: int, options: dict, path: str) -> str:
+    """
+    提取一页并写入缓存（先写临时文件再改名），返回该页的markdown
+    """
+    import pymupdf4llm
+
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    text = pymupdf4llm.to_markdown(_open_document(pdf_path), pages=[page], show_progress=False, **options)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(f"{path}.tmp", path)
+    return text
+
+
+def _extract_page_args(args: tuple) -> str:
+    return extract_page(*args)
+
+
+def convert_pdf(pdf_path: str, md_path: str, pages: str|None=None, options: dict|None=None,
+                max_workers: int|None=None, cache_dir: str=CACHE_DIR) -> dict:
+    """
+    逐页并行提取一个pdf，按页码顺序流式写出markdown
+
+    Returns:
+        dict: {'pages': 页数, 'cached': 命中缓存的页数}
+    """
+    import pymupdf
+
+    options = options or {}
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+
+    pdf_hash = file_hash(pdf_path)
+    opt_hash = options_hash(options)
+    page_list = parse_page_ranges(pages, page_count)
+    paths = [cache_path(cache_dir, pdf_hash, opt_hash, p) for p in page_list]
+    cached = sum(1 for path in paths if os.path.exists(path))
+
+    tasks = [(pdf_path, p, options, path) for p, path in zip(page_list, paths)]
+    with open(md_path, "w", encoding="utf-8") as f_out:
+        if max_workers == 1 or cached == len(tasks):
+            results = map(_extract_page_args, tasks)
+            for text in results:
+                f_out.write(text)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                # map按提交顺序返回结果，完成一页写出一页
+                for text in executor.map(_extract_page_args, tasks, chunksize=4):
+                    f_out.write(text)
+
+    return {'pages': len(page_list), 'cached': cached}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用pymupdf4llm将pdf转换为markdown")
+    parser.add_argument("pdf_paths", nargs="+", help="一个或多个pdf文件")
+    parser.add_argument("--pages", help="页码范围（1起），如1-20,35；默认全部")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数，默认CPU核数")
+    parser.add_argument("--options", default="{}", help="传给pymupdf4llm.to_markdown的参数（JSON）")
+    parser.add_argument("--out-dir", help="输出目录，默认与pdf同目录")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help=f"缓存目录，默认{CACHE_DIR}")
+    args = parser.parse_args()
 
-with open("1.md", "w", encoding="utf-8") as md_file:
-    md_file.write(md_text)
+    extract_options = json.loads(args.options)
+    for pdf_file in args.pdf_paths:
+        if not os.path.exists(pdf_file):
+            print(f"错误：输入文件 {pdf_file} 不存在")
+            sys.exit(1)
+        base_name = os.path.splitext(os.path.basename(pdf_file))[0]
+        out_dir = args.out_dir or os.path.dirname(pdf_file)
+        md_file = os.path.join(out_dir, f"{base_name}.md")
+        stats = convert_pdf(pdf_file, md_file, args.pages, extract_options, args.workers, args.cache_dir)
+        print(f"{pdf_file} -> {md_file}：{stats['pages']}页，其中{stats['cached']}页来自缓存")
@@ -0,0 +1,246 @@
+"""
+参考资料的本地检索索引
+
+1. 把参考资料文件夹中的文本（.md、.txt）按空行分为段落，合并为不超过passage_size字的检索单元；
+2. 以汉字二元组（英文、数字按词）建立倒排索引，用BM25打分，索引保存为gzip压缩的JSON；
+   资料文件变化（文件名、大小、修改时间）后自动重建；
+3. 为每个片段检索最相关的k段资料，在token预算内写入片段的reference字段。
+
+用法（在项目根目录）：
+    python -m src.reference_index build 参考资料文件夹 [--index 索引路径]
+    python -m src.reference_index attach 切分好的JSON 参考资料文件夹 [--k 3] [--budget 800]
+"""
+import os
+import re
+import sys
+import json
+import gzip
+import math
+import heapq
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+
+from src.splitter import estimate_tokens
+
+TERM_PATTERN = re.compile(r'[一-鿿]+|[A-Za-z0-9]+')
+SOURCE_SUFFIXES = (".md", ".txt")
+# BM25参数
+K1 = 1.2
+B = 0.75
+# 出现在超过此比例的检索单元中的词区分度很低，检索时忽略
+MAX_DF_RATIO = 0.2
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    汉字按二元组（单字成段时取单字），英文、数字按词（小写）
+    """
+    terms = []
+    for run in TERM_PATTERN.findall(text):
+        if run[0] >= '一':
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[k:k+2] for k in range(len(run) - 1))
+        else:
+            terms.append(run.lower())
+    return terms
+
+
+def split_passages(text: str, passage_size: int=300) -> list[str]:
+    """
+    按空行分段，相邻短段合并，使每个检索单元不超过passage_size字（单个长段落不再切分）
+    """
+    passages = []
+    current = ""
+    for block in re.split(r'\n\s*\n', text):
+        block = block.strip()
+        if not block:
+            continue
+        if current and len(current) + len(block) > passage_size:
+            passages.append(current)
+            current = block
+        else:
+            current = f"{current}\n\n{block}" if current else block
+    if current:
+        passages.append(current)
+    return passages
+
+
+def source_files(source_dir: str) -> list[str]:
+    """参考资料文件夹中的文本文件（相对路径，排序）"""
+    files = []
+    for root, _, names in os.walk(source_dir):
+        for name in names:
+            if name.endswith(SOURCE_SUFFIXES):
+                files.append(os.path.relpath(os.path.join(root, name), source_dir))
+    return sorted(files)
+
+
+def sources_fingerprint(source_dir: str) -> list:
+    """资料文件的文件名、大小和修改时间"""
+    fingerprint = []
+    for name in source_files(source_dir):
+        stat = os.stat(os.path.join(source_dir, name))
+        fingerprint.append([name, stat.st_size, int(stat.st_mtime)])
+    return fingerprint
+
+
+def build_index(source_dir: str, passage_size: int=300) -> dict:
+    """
+    建立索引：{"sources", "passages", "doc_len", "avgdl", "postings"}
+
+    postings: 词 → [单元号, 词频, 单元号, 词频, ...]
+    """
+    passages = []
+    for name in source_files(source_dir):
+        with open(os.path.join(source_dir, name), "r", encoding="utf-8") as f:
+            passages.extend({"source": name, "text": p} for p in split_passages(f.read(), passage_size))
+
+    postings = defaultdict(list)
+    doc_len = []
+    for pid, passage in enumerate(passages):
+        counts = Counter(tokenize(passage["text"]))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings[term].extend((pid, tf))
+
+    return {
+        "sources": sources_fingerprint(source_dir),
+        "passage_size": passage_size,
+        "passages": passages,
+        "doc_len": doc_len,
+        "avgdl": sum(doc_len) / len(doc_len) if doc_len else 0.0,
+        "postings": postings,
+    }
+
+
+def save_index(index: dict, index_path: str) -> None:
+    """
+    保存为gzip压缩的JSON
+
+    先写同目录下的临时文件（文件名各不相同，几个进程同时保存也不会写到一起）再改名替换
+    """
+    directory = os.path.dirname(index_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(index_path)}.", suffix=".tmp")
+    try:
+        # 最低压缩级别：体积已小很多，保存比默认级别快十几倍
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8", compresslevel=1) as f:
+            # 下划线开头的是检索时算出的缓存，不保存
+            json.dump({k: v for k, v in index.items() if not k.startswith("_")}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_index(source_dir: str, index_path: str|None=None, passage_size: int=300) -> dict:
+    """
+    读取索引；索引不存在或资料文件有变化时重建并保存
+
+    index_path默认为`参考资料文件夹/.reference.index.json.gz`
+    """
+    index_path = index_path or os.path.join(source_dir, ".reference.index.json.gz")
+    if os.path.exists(index_path):
+        with gzip.open(index_path, "rt", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("sources") == sources_fingerprint(source_dir) and index.get("passage_size") == passage_size:
+            return index
+    index = build_index(source_dir, passage_size)
+    save_index(index, index_path)
+    return index
+
+
+def search(index: dict, text: str, k: int=3) -> list[tuple[float, int]]:
+    """
+    BM25检索，返回最相关的k个(得分, 单元号)
+    """
+    n = len(index["doc_len"])
+    if not n:
+        return []
+    postings = index["postings"]
+    # 各单元的长度归一化项只与索引有关，首次检索时算好
+    if "_norm" not in index:
+        avgdl = index["avgdl"] or 1.0
+        index["_norm"] = [K1 * (1 - B + B * dl / avgdl) for dl in index["doc_len"]]
+    norm = index["_norm"]
+    max_df = max(1, int(n * MAX_DF_RATIO))
+
+    scores = defaultdict(float)
+    for term, qtf in Counter(tokenize(text)).items():
+        plist = postings.get(term)
+        if not plist:
+            continue
+        df = len(plist) // 2
+        if df > max_df and n > 10:
+            continue
+        weight = qtf * math.log(1 + (n - df + 0.5) / (df + 0.5)) * (K1 + 1)
+        for pid, tf in zip(plist[::2], plist[1::2]):
+            scores[pid] += weight * tf / (tf + norm[pid])
+    return heapq.nlargest(k, ((score, pid) for pid, score in scores.items()))
+
+
+def retrieve_reference(index: dict, text: str, k: int=3, token_budget: int=800) -> str:
+    """
+    检索相关资料，按相关度依次加入，不超过token_budget；每段注明出处
+    """
+    selected = []
+    used = 0
+    for _, pid in search(index, text, k):
+        passage = index["passages"][pid]
+        block = f"（{passage['source']}）\n{passage['text']}"
+        tokens = estimate_tokens(block)
+        if used + tokens > token_budget:
+            continue
+        selected.append(block)
+        used += tokens
+    return "\n\n".join(selected)
+
+
+def attach_references(segments: list[dict], index: dict, k: int=3, token_budget: int=800) -> list[dict]:
+    """
+    为每个片段的target检索资料，写入reference字段；已有reference的片段不变（重复运行不会重复添加）
+    """
+    for segment in segments:
+        if segment.get("reference"):
+            continue
+        reference = retrieve_reference(index, segment["target"], k, token_budget)
+        if reference:
+            segment["reference"] = reference
+    return segments
+
+
+def main(argv: list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(description="参考资料检索索引")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("build", help="建立（或更新）索引")
+    p.add_argument("source_dir")
+    p.add_argument("--index", default=None, help="索引路径，默认在参考资料文件夹中")
+    p.add_argument("--passage-size", type=int, default=300)
+
+    p = commands.add_parser("attach", help="为切分好的JSON添加参考资料")
+    p.add_argument("json")
+    p.add_argument("source_dir")
+    p.add_argument("--index", default=None)
+    p.add_argument("--passage-size", type=int, default=300)
+    p.add_argument("--k", type=int, default=3, help="每个片段最多取几段资料")
+    p.add_argument("--budget", type=int, default=800, help="每个片段资料的token上限（估算）")
+
+    args = parser.parse_args(argv)
+    index = load_index(args.source_dir, args.index, args.passage_size)
+    if args.command == "build":
+        print(f"索引: {len(index['sources'])} 个文件，{len(index['passages'])} 个检索单元")
+    elif args.command == "attach":
+        from src.proofreader import write_json_atomic
+        with open(args.json, "r", encoding="utf-8") as f:
+            segments = json.load(f)
+        attach_references(segments, index, args.k, args.budget)
+        write_json_atomic(args.json, segments)
+        print(f"已为 {sum(1 for s in segments if s.get('reference'))}/{len(segments)} 个片段添加参考资料")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
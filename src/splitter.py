@@ -2,15 +2,116 @@
 用于分拆markdown文件的工具模块
 """
 
+import re
 from typing import List
 
-def cut_text_by_length(text: str, cut_by: int=600) -> List[str]:
+# 句末标点及其后的引号、括号、脚注标记（如“。”[^a]），切分时不与前面的标点分开
+SENTENCE_END_PATTERN = re.compile(r'[。！？；!?;]+[”’」』）)]*(?:\[\^[^\]\s]+\])*')
+# 句中停顿的标点
+CLAUSE_END_PATTERN = re.compile(r'[，、：,:]+[”’」』）)]*(?:\[\^[^\]\s]+\])*')
+FOOTNOTE_MARK_PATTERN = re.compile(r'\[\^[^\]\s]+\]')
+OPEN_QUOTES = '“‘「『（('
+CLOSE_QUOTES = '”’」』）)'
+# 超长文本依次尝试的切分位置：换行、句末、句中停顿，最后按长度硬切
+SPLIT_LEVELS = ("line", "sentence", "clause")
+
+# 上下文策略，见split_markdown_by_title_and_length_with_context
+CONTEXT_POLICIES = ("section", "window", "neighbors")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算token数：中文字符约0.6个token，其余字符约0.3个
+    """
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+def _boundaries(text: str, level: str) -> List[int]:
+    """
+    某一级的切分位置（切在该位置之前）；句末、句中停顿不切在引号、括号之内
+    """
+    if level == "line":
+        return [m.end() for m in re.finditer('\n', text)]
+    pattern = SENTENCE_END_PATTERN if level == "sentence" else CLAUSE_END_PATTERN
+    cuts = []
+    depth = 0
+    pos = 0
+    for m in pattern.finditer(text):
+        for ch in text[pos:m.end()]:
+            if ch in OPEN_QUOTES:
+                depth += 1
+            elif ch in CLOSE_QUOTES and depth:
+                depth -= 1
+        pos = m.end()
+        if depth == 0:
+            cuts.append(m.end())
+    return cuts
+
+
+def _hard_cut(text: str, max_length: int) -> List[str]:
+    """
+    按长度硬切，不切断脚注标记
+    """
+    marks = [m.span() for m in FOOTNOTE_MARK_PATTERN.finditer(text)]
+    pieces = []
+    start = 0
+    while len(text) - start > max_length:
+        cut = start + max_length
+        for mark_start, mark_end in marks:
+            if mark_start < cut < mark_end and mark_start > start:
+                cut = mark_start
+                break
+        pieces.append(text[start:cut])
+        start = cut
+    pieces.append(text[start:])
+    return pieces
+
+
+def split_long_text(text: str, max_length: int, cut_by: int|None=None, level: int=0) -> List[str]:
+    """
+    把超过max_length的文本逐级切分：换行 → 句末（。！？；）→ 句中停顿（，、：）→ 按长度硬切
+
+    每级切出的单元依次合并，达到cut_by（默认为max_length）或再加就超过max_length时另起一段；
+    仍超长的单元交给下一级。保证每段不超过max_length，各段连起来与原文相同；
+    引号、括号之内不切，脚注标记（如[^a]）跟随前面的标点
+    """
+    cut_by = min(cut_by or max_length, max_length)
+    if len(text) <= max_length:
+        return [text]
+    if level >= len(SPLIT_LEVELS):
+        return _hard_cut(text, max_length)
+
+    cuts = _boundaries(text, SPLIT_LEVELS[level])
+    units = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)]) if b > a]
+    pieces = []
+    current = ""
+    for unit in units:
+        if len(unit) > max_length:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.extend(split_long_text(unit, max_length, cut_by, level + 1))
+            continue
+        if current and (len(current) >= cut_by or len(current) + len(unit) > max_length):
+            pieces.append(current)
+            current = ""
+        current += unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def cut_text_by_length(text: str, cut_by: int=600, max_length: int|None=None) -> List[str]:
     """
     将文本大致按长度切分（在指定长度前后最近一个空行处）
 
+    没有空行的长文本（如OCR后合并了行的PDF文本）另按句子等逐级切分，每段不超过max_length，
+    见split_long_text；句中切开的片段如何拼回，见piece_joiners
+
     Args:
         text (str): 文本
         length (int): 长度
+        max_length (int|None): 每段的最大长度，默认为cut_by的2倍
 
     Returns:
         List[str]: 切分后的文本列表
@@ -39,8 +140,36 @@ def cut_text_by_length(text: str, cut_by: int=600) -> List[str]:
     if current_chunk:
         result.append('\n'.join(current_chunk))
 
+    # 超长的块逐级切分
+    max_length = max(int(max_length or 2 * cut_by), cut_by)
+    if any(len(chunk) > max_length for chunk in result):
+        result = [piece for chunk in result for piece in split_long_text(chunk, max_length, cut_by)]
+
     return result
 
+def piece_joiners(text: str, pieces: List[str]) -> List[str]:
+    """
+    各片段在原文中与下一片段的衔接，校对后按此拼回（最后一段为"\n\n"）：
+    句中切开的为两段之间的空白（通常为""），只隔一个换行的为"\n"，隔空行的为"\n\n"
+    """
+    spans = []
+    start = 0
+    for piece in pieces:
+        found = text.find(piece, start)
+        if found >= 0:
+            start = found
+        spans.append((start, start + len(piece)))
+        start += len(piece)
+    joiners = []
+    for (_, end), (next_start, _), piece, next_piece in zip(spans, spans[1:], pieces, pieces[1:]):
+        # 衔接处的空白：本段末尾、两段之间、下一段开头
+        seam = piece[len(piece.rstrip()):] + text[end:next_start] + next_piece[:len(next_piece) - len(next_piece.lstrip())]
+        newlines = seam.count("\n")
+        joiners.append(seam if newlines == 0 else "\n" if newlines == 1 else "\n\n")
+    if pieces:
+        joiners.append("\n\n")
+    return joiners
+
 def cut_text_in_list_by_length(text_list: List[str], threshold:int=1500, cut_by:int=800) -> List[str]:
     """将列表中的超长段落切分为多个短段落
 
@@ -104,26 +233,71 @@ def split_markdown_by_title(text: str, levels: list[int]=[2]) -> List[str]:
 
     return raw_paragraphs
 
-def split_markdown_by_title_and_length_with_context(text: str, levels: list[int]=[2], cut_by: int=600) -> List[dict]:
+def update_heading_path(path: List[str], text: str) -> List[str]:
+    """
+    按文本中的标题行更新标题路径（各级标题组成的列表，依次为一级、二级……）
+    """
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            continue
+        level = len(line) - len(line.lstrip('#'))
+        if line[level:level+1] != ' ':
+            continue
+        path = [h for h in path if len(h) - len(h.lstrip('#')) < level] + [line]
+    return path
+
+
+def split_markdown_by_title_and_length_with_context(text: str, levels: list[int]=[2], cut_by: int=600,
+                                                    context_policy: str="section", context_chars: int=600,
+                                                    context_neighbors: int=1) -> List[dict]:
     """
     1. 将markdown文本按标题级别切分;
     2. 再按cut_by字符切分，作为target；
-    3. 保留完整上下文，作为context；
+    3. 按context_policy准备上下文，作为context：
+        "section": 完整的章节（默认）；长章节的上下文可达目标的几十倍；
+        "window": 章节中目标前后各context_chars个字符；
+        "neighbors": 标题路径（上级各级标题）加前后各context_neighbors个片段；
+    4. 上下文的token数（估算；与目标相同、不会发送的为0）记入context_tokens；
+    5. 与下一片段不是隔空行衔接的（句中切开等），衔接方式记入joiner，见piece_joiners
     """
+    if context_policy not in CONTEXT_POLICIES:
+        raise ValueError(f"未知的上下文策略: {context_policy}")
+
     # 按标题切分文本
     raw_paragraphs = split_markdown_by_title(text, levels=levels)
 
     # 长文本按cut_by字符切分，并添加target标签并保留上下文
     label_paragraphs = []
+    heading_path: List[str] = []
     for paragraph in raw_paragraphs:
         pieces = cut_text_by_length(paragraph, cut_by=cut_by)
+        joiners = piece_joiners(paragraph, pieces)
         new_pieces = []
+        start = 0
         # 为每个片段添加target标签并保留上下文
-        for piece in pieces:
+        for k, piece in enumerate(pieces):
+            # 片段之间可能有换行，也可能直接相连（句中切开的），按片段在原文中的实际位置定位
+            found = paragraph.find(piece, start)
+            if found >= 0:
+                start = found
+            if context_policy == "window":
+                context = paragraph[max(0, start - context_chars):start + len(piece) + context_chars]
+            elif context_policy == "neighbors":
+                # 标题路径取片段之前的，已在相邻片段中的标题不再重复
+                neighbors = '\n'.join(pieces[max(0, k - context_neighbors):k + context_neighbors + 1])
+                neighbor_lines = set(neighbors.splitlines())
+                context = ''.join(f"{h}\n" for h in heading_path if h not in neighbor_lines) + neighbors
+            else:
+                context = paragraph
+            heading_path = update_heading_path(heading_path, piece)
+            start += len(piece)
             dict_piece = {
-                'context': paragraph,
+                'context': context,
                 'target': piece,
+                'context_tokens': 0 if context.strip() == piece.strip() else estimate_tokens(context),
             }
+            if joiners[k] != "\n\n":
+                dict_piece['joiner'] = joiners[k]
             new_pieces.append(dict_piece)
         label_paragraphs.extend(new_pieces)
 
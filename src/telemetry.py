@@ -0,0 +1,206 @@
+"""
+校对请求的遥测
+
+1. 每个请求一条结构化记录，追加写入JSONL文件；
+2. 结束时汇总延迟分位数（p50/p95/p99）、token吞吐量和费用；
+3. 长时间批处理时，可开启Prometheus格式的文本端点（/metrics）。
+"""
+import json
+import time
+import threading
+
+# 价格：元/百万token，(输入缓存命中, 输入缓存未命中, 输出)，见各平台定价页面
+PRICES = {
+    "deepseek-chat": (0.5, 2.0, 8.0),
+    "deepseek-reasoner": (1.0, 4.0, 16.0),
+    "deepseek-v3": (0.8, 2.0, 8.0),
+    "deepseek-r1": (1.6, 4.0, 16.0),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int|None, completion_tokens: int|None, cached_tokens: int|None=0) -> float|None:
+    """
+    估算一次请求的费用（元）；未知模型或缺少用量时返回None
+    """
+    if model not in PRICES or prompt_tokens is None or completion_tokens is None:
+        return None
+    hit_price, miss_price, output_price = PRICES[model]
+    cached_tokens = cached_tokens or 0
+    return ((cached_tokens * hit_price
+             + (prompt_tokens - cached_tokens) * miss_price
+             + completion_tokens * output_price) / 1_000_000)
+
+
+def percentile(values: list[float], q: float) -> float|None:
+    """
+    线性插值的分位数，q取0-100
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+def read_usage(usage) -> dict:
+    """
+    从OpenAI兼容接口的usage中取出token用量
+
+    DeepSeek用prompt_cache_hit_tokens表示缓存命中，OpenAI用prompt_tokens_details.cached_tokens
+    """
+    if usage is None:
+        return {}
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "cached_tokens": cached or 0,
+    }
+
+
+class Telemetry:
+    """
+    收集每个请求的记录，线程安全
+
+    记录字段：index（片段号，从1开始）、provider、model、status（ok/failed）、
+    queue_wait、rate_limit_wait、latency、ttft（秒）、
+    prompt_tokens、completion_tokens、cached_tokens、retries、cost、time
+    """
+    def __init__(self, path: str|None=None):
+        self.path = path
+        self.records: list[dict] = []
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.server = None
+
+    def record(self, **fields) -> dict:
+        """
+        添加一条记录，并追加写入JSONL文件
+        """
+        fields.setdefault("time", time.time())
+        if fields.get("cost") is None and "model" in fields:
+            fields["cost"] = estimate_cost(fields["model"], fields.get("prompt_tokens"),
+                                           fields.get("completion_tokens"), fields.get("cached_tokens"))
+        with self.lock:
+            self.records.append(fields)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        return fields
+
+    def summary(self) -> dict:
+        """
+        汇总：请求数、成功数、延迟分位数、token数、吞吐量、费用
+        """
+        with self.lock:
+            records = list(self.records)
+        ok = [r for r in records if r.get("status") == "ok"]
+        latencies = [r["latency"] for r in ok if r.get("latency") is not None]
+        completion_tokens = sum(r.get("completion_tokens") or 0 for r in ok)
+        prompt_tokens = sum(r.get("prompt_tokens") or 0 for r in ok)
+        wall_time = time.time() - self.start_time
+        return {
+            "requests": len(records),
+            "ok": len(ok),
+            "failed": len(records) - len(ok),
+            "retries": sum(r.get("retries") or 0 for r in records),
+            "resplit": sum(1 for r in records if r.get("resplit")),
+            "hedged": sum(1 for r in records if r.get("hedged")),
+            "hedge_won": sum(1 for r in records if r.get("hedge_won")),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": sum(r.get("cached_tokens") or 0 for r in ok),
+            "wall_time": wall_time,
+            "tokens_per_second": completion_tokens / wall_time if wall_time > 0 else 0.0,
+            "cost": sum(r.get("cost") or 0 for r in records),
+        }
+
+    def format_summary(self) -> str:
+        """
+        供打印和写入日志的汇总文本
+        """
+        s = self.summary()
+
+        def seconds(value):
+            return "-" if value is None else f"{value:.2f}s"
+
+        return (
+            f"请求数: {s['requests']}（成功 {s['ok']}，失败 {s['failed']}，重试 {s['retries']}）\n"
+            + (f"应答不完整、切分后重新校对的片段: {s['resplit']}\n" if s['resplit'] else "")
+            + (f"对冲请求: {s['hedged']}（对冲一方胜出 {s['hedge_won']}）\n" if s['hedged'] else "") +
+            f"延迟 p50/p95/p99: {seconds(s['latency_p50'])} / {seconds(s['latency_p95'])} / {seconds(s['latency_p99'])}\n"
+            f"token 输入/输出/缓存命中: {s['prompt_tokens']} / {s['completion_tokens']} / {s['cached_tokens']}\n"
+            f"输出吞吐量: {s['tokens_per_second']:.1f} tokens/s，总用时 {s['wall_time']:.1f}s\n"
+            f"估算费用: {s['cost']:.4f} 元\n"
+        )
+
+    def prometheus_text(self) -> str:
+        """
+        Prometheus文本格式的指标
+        """
+        s = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, value, labels=""):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{labels} {0 if value is None else value}")
+
+        metric("proofread_requests_total", "counter", "Finished requests", s["ok"], '{status="ok"}')
+        lines.append(f'proofread_requests_total{{status="failed"}} {s["failed"]}')
+        metric("proofread_retries_total", "counter", "API retries", s["retries"])
+        lines.append("# HELP proofread_latency_seconds Request latency quantiles")
+        lines.append("# TYPE proofread_latency_seconds summary")
+        for q in (50, 95, 99):
+            value = s[f"latency_p{q}"]
+            lines.append(f'proofread_latency_seconds{{quantile="{q/100}"}} {0 if value is None else value}')
+        metric("proofread_prompt_tokens_total", "counter", "Prompt tokens", s["prompt_tokens"])
+        metric("proofread_completion_tokens_total", "counter", "Completion tokens", s["completion_tokens"])
+        metric("proofread_cached_tokens_total", "counter", "Prompt cache hit tokens", s["cached_tokens"])
+        metric("proofread_tokens_per_second", "gauge", "Completion tokens per second of wall time", s["tokens_per_second"])
+        metric("proofread_cost_total", "counter", "Estimated cost (CNY)", s["cost"])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str="127.0.0.1"):
+        """
+        在后台线程开启/metrics文本端点
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def close(self) -> None:
+        """
+        关闭文本端点
+        """
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,333 @@
+"""
+多进程、多机校对的共享工作队列（SQLite）
+
+不再手工修改start_count/stop_count分配片段：
+1. 协调者把切分好的JSON载入SQLite数据库（init），已有的校对结果直接标为完成；
+2. 任意多个工作进程（work）各自领取片段：领取时写入租约期限，处理中定时续租（心跳），
+   完成后提交结果；进程崩溃后租约过期，片段由其他工作进程重新领取；
+3. 全部完成（或随时）导出校对结果JSON和Markdown（export）。
+
+同一台机器上用WAL模式；放在共享文件系统（NFS、SMB）上时，WAL所需的共享内存不可用，
+请在init时加--no-wal，改用回滚日志和文件锁。
+
+每个工作进程各自限速（rpm），可给不同进程配置不同的API key以成倍提高吞吐量。
+
+用法（在项目根目录）：
+    python -m src.work_queue init example/your_markdown.json [--db 路径] [--no-wal]   （再次init可重试失败的片段）
+    python -m src.work_queue work example/your_markdown.json.queue.db [--model deepseek-chat] [--rpm 15] [--concurrency 3]
+    python -m src.work_queue status example/your_markdown.json.queue.db
+    python -m src.work_queue export example/your_markdown.json.queue.db [example/your_markdown.proofread.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from src.proofreader import RateLimiter, tag_paragraph, model_provider, call_model_async, write_json_atomic, join_results
+from src.telemetry import Telemetry
+
+# 租约时长（秒）；处理中每隔LEASE_SECONDS/3续租一次
+LEASE_SECONDS = 120
+# 同一片段最多尝试的次数，超过后标为失败
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    idx INTEGER PRIMARY KEY,        -- 片段号（从0开始）
+    paragraph TEXT NOT NULL,        -- 片段JSON（target、context、reference）
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending/leased/done/failed
+    result TEXT,
+    worker TEXT,
+    lease_until REAL,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS segments_status ON segments (status, idx);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def connect(db_path: str, wal: bool|None=None) -> sqlite3.Connection:
+    """
+    打开数据库；wal为None时沿用数据库已有的日志模式
+    """
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if wal is not None:
+        conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def init_queue(json_in: str, db_path: str|None=None, json_out: str|None=None, wal: bool=True) -> str:
+    """
+    协调者：把切分好的JSON载入数据库，返回数据库路径
+
+    json_out中已有的校对结果标为完成。数据库已存在时（如重新切分后再次init）：
+    内容未变的片段保留原有状态和结果，内容变了的重置为待处理（或json_out中的结果），
+    新增的片段补充进来，多出的片段删去；尝试次数用尽而失败的片段重置为待处理（尝试次数清零），
+    API暂时不可用等造成的失败，再次init后即可重试
+    """
+    db_path = db_path or f"{json_in}.queue.db"
+    json_out = json_out or json_in.removesuffix(".json") + ".proofread.json"
+    with open(json_in, "r", encoding="utf-8") as f:
+        paragraphs = json.load(f)
+    previous = []
+    if os.path.exists(json_out):
+        with open(json_out, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if len(previous) != len(paragraphs):
+            raise ValueError(f"输出 JSON 的长度与输入 JSON 的长度不同: {len(previous)} != {len(paragraphs)}")
+
+    conn = connect(db_path, wal)
+    now = time.time()
+    conn.executescript(SCHEMA)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = {row["idx"]: row["paragraph"] for row in conn.execute("SELECT idx, paragraph FROM segments")}
+        reset = 0
+        for i, paragraph in enumerate(paragraphs):
+            text = json.dumps(paragraph, ensure_ascii=False)
+            if existing.get(i) == text:
+                continue
+            reset += i in existing
+            done = i < len(previous) and previous[i] is not None
+            conn.execute(
+                "INSERT OR REPLACE INTO segments (idx, paragraph, status, result, updated) VALUES (?, ?, ?, ?, ?)",
+                (i, text, "done" if done else "pending", previous[i] if done else None, now))
+        removed = conn.execute("DELETE FROM segments WHERE idx >= ?", (len(paragraphs),)).rowcount
+        retried = conn.execute(
+            "UPDATE segments SET status = 'pending', attempts = 0, worker = NULL, lease_until = NULL, updated = ? "
+            "WHERE status = 'failed'", (now,)).rowcount
+        if reset or removed:
+            print(f"内容有变化、重置为待处理的片段: {reset}，删去的片段: {removed}")
+        if retried:
+            print(f"以前失败、重置为待处理的片段: {retried}")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('json_in', ?), ('json_out', ?)", (json_in, json_out))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return db_path
+
+
+def claim(conn: sqlite3.Connection, worker: str, lease_seconds: float=LEASE_SECONDS) -> tuple[int, dict]|None:
+    """
+    领取一个待处理或租约已过期的片段，返回(片段号, 片段)；没有可领取的返回None
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 尝试次数用尽且租约已过期的片段标为失败
+        conn.execute("UPDATE segments SET status = 'failed', updated = ? "
+                     "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, MAX_ATTEMPTS))
+        row = conn.execute(
+            "SELECT idx, paragraph FROM segments "
+            "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) ORDER BY idx LIMIT 1",
+            (now,)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE segments SET status = 'leased', worker = ?, lease_until = ?, heartbeat = ?, "
+            "attempts = attempts + 1, updated = ? WHERE idx = ?",
+            (worker, now + lease_seconds, now, now, row["idx"]))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return row["idx"], json.loads(row["paragraph"])
+
+
+def heartbeat(conn: sqlite3.Connection, idx: int, worker: str, lease_seconds: float=LEASE_SECONDS) -> bool:
+    """
+    续租；租约已被他人取得时返回False
+    """
+    now = time.time()
+    cursor = conn.execute(
+        "UPDATE segments SET lease_until = ?, heartbeat = ? WHERE idx = ? AND worker = ? AND status = 'leased'",
+        (now + lease_seconds, now, idx, worker))
+    return cursor.rowcount == 1
+
+
+def complete(conn: sqlite3.Connection, idx: int, worker: str, result: str, paragraph: dict|None=None) -> bool:
+    """
+    提交结果；片段已由他人完成、或（传入paragraph时）其内容已被重新init改变时不覆盖，返回False
+    """
+    if paragraph is None:
+        cursor = conn.execute(
+            "UPDATE segments SET status = 'done', result = ?, worker = ?, lease_until = NULL, updated = ? "
+            "WHERE idx = ? AND status != 'done'",
+            (result, worker, time.time(), idx))
+    else:
+        cursor = conn.execute(
+            "UPDATE segments SET status = 'done', result = ?, worker = ?, lease_until = NULL, updated = ? "
+            "WHERE idx = ? AND status != 'done' AND paragraph = ?",
+            (result, worker, time.time(), idx, json.dumps(paragraph, ensure_ascii=False)))
+    return cursor.rowcount == 1
+
+
+def release(conn: sqlite3.Connection, idx: int, worker: str) -> None:
+    """
+    处理失败，交还片段；尝试次数用尽的标为失败
+    """
+    conn.execute(
+        "UPDATE segments SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "lease_until = NULL, updated = ? WHERE idx = ? AND worker = ? AND status = 'leased'",
+        (MAX_ATTEMPTS, time.time(), idx, worker))
+
+
+def queue_status(conn: sqlite3.Connection) -> dict:
+    """
+    各状态的片段数；租约过期的计入expired
+    """
+    counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0, "expired": 0}
+    for row in conn.execute("SELECT status, COUNT(*) AS n FROM segments GROUP BY status"):
+        counts[row["status"]] = row["n"]
+    counts["expired"] = conn.execute(
+        "SELECT COUNT(*) FROM segments WHERE status = 'leased' AND lease_until < ?", (time.time(),)).fetchone()[0]
+    return counts
+
+
+async def run_worker(db_path: str, model: str="deepseek-chat", rpm: int=15, max_concurrent: int=3,
+                     worker: str|None=None, lease_seconds: float=LEASE_SECONDS, mode: str="full") -> int:
+    """
+    工作进程：领取、校对、提交，直到没有待处理和租用中的片段；返回本进程完成的片段数
+
+    暂时没有可领取的片段、但还有其他进程租用中的片段时，每隔lease_seconds/3查看一次，
+    租用者崩溃、租约过期后接手
+
+    同一进程内max_concurrent个并发请求共用一个限速器；mode见proofreader.call_model_async
+    """
+    if model_provider(model) is None:
+        raise ValueError(f"不支持的模型: {model}")
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    conn = connect(db_path)
+    rate_limiter = RateLimiter(rpm)
+    telemetry = Telemetry(f"{db_path}.requests.jsonl")
+    executor = ThreadPoolExecutor(max_workers=max_concurrent)
+    done_count = 0
+
+    async def keep_alive(idx: int):
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not heartbeat(conn, idx, worker, lease_seconds):
+                print(f"片段 {idx+1} 的租约已失效")
+                return
+
+    async def work():
+        nonlocal done_count
+        while True:
+            item = claim(conn, worker, lease_seconds)
+            if item is None:
+                counts = queue_status(conn)
+                if not counts["pending"] and not counts["leased"]:
+                    return
+                await asyncio.sleep(lease_seconds / 3)
+                continue
+            idx, paragraph = item
+            pre_text, post_text = tag_paragraph(paragraph)
+            print(f"[{worker}] 处理 {idx+1}:\n{paragraph['target'][:30]} ...\n")
+            keeper = asyncio.create_task(keep_alive(idx))
+            start_time = time.time()
+            try:
+                await rate_limiter.wait()
+                rate_limit_wait = time.time() - start_time
+                stats = {}
+                processed_text = await call_model_async(model, pre_text, post_text, stats, executor, mode)
+            except BaseException:
+                release(conn, idx, worker)
+                raise
+            finally:
+                keeper.cancel()
+            telemetry.record(index=idx+1, provider=model_provider(model), model=model, worker=worker,
+                             status="ok" if processed_text else "failed", rate_limit_wait=rate_limit_wait,
+                             length=len(paragraph["target"]), **stats)
+            if processed_text:
+                if complete(conn, idx, worker, processed_text, paragraph):
+                    done_count += 1
+                print(f"[{worker}] 完成 {idx+1} 用时 {time.time() - start_time:.2f}s\n{'-'*40}\n")
+            else:
+                release(conn, idx, worker)
+                print(f"[{worker}] 片段 {idx+1} 处理失败，交还队列\n{'-'*40}\n")
+
+    try:
+        await asyncio.gather(*(work() for _ in range(max_concurrent)))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        print(telemetry.format_summary())
+        telemetry.close()
+        conn.close()
+    return done_count
+
+
+def export_results(db_path: str, json_out: str|None=None) -> list[str|None]:
+    """
+    导出校对结果JSON（未完成的为None）和只含已完成片段的Markdown
+    """
+    conn = connect(db_path)
+    try:
+        json_out = json_out or conn.execute("SELECT value FROM meta WHERE key = 'json_out'").fetchone()[0]
+        rows = conn.execute("SELECT paragraph, status, result FROM segments ORDER BY idx").fetchall()
+        paragraphs = [json.loads(row["paragraph"]) for row in rows]
+        output = [row["result"] if row["status"] == "done" else None for row in rows]
+    finally:
+        conn.close()
+    write_json_atomic(json_out, output)
+    with open(f"{json_out}.md", "w", encoding="utf-8") as f:
+        f.write(join_results(paragraphs, output))
+    return output
+
+
+def main(argv: list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(description="共享工作队列校对")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("init", help="载入切分好的JSON")
+    p.add_argument("json_in")
+    p.add_argument("--db", default=None, help="数据库路径，默认为`输入JSON.queue.db`")
+    p.add_argument("--json-out", default=None, help="校对结果JSON，默认为`输入文件名.proofread.json`")
+    p.add_argument("--no-wal", action="store_true", help="用于共享文件系统")
+
+    p = commands.add_parser("work", help="领取并校对片段")
+    p.add_argument("db")
+    p.add_argument("--model", default="deepseek-chat")
+    p.add_argument("--rpm", type=int, default=15)
+    p.add_argument("--concurrency", type=int, default=3)
+    p.add_argument("--worker", default=None, help="工作进程名，默认为`主机名:进程号`")
+    p.add_argument("--lease", type=float, default=LEASE_SECONDS, help="租约时长（秒）")
+    p.add_argument("--mode", default="full", choices=["full", "edits"], help="模型输出全文或修改清单")
+
+    p = commands.add_parser("status", help="查看进度")
+    p.add_argument("db")
+
+    p = commands.add_parser("export", help="导出校对结果")
+    p.add_argument("db")
+    p.add_argument("json_out", nargs="?", default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "init":
+        db_path = init_queue(args.json_in, args.db, args.json_out, wal=not args.no_wal)
+        print(f"已载入: {db_path}")
+    elif args.command == "work":
+        done_count = asyncio.run(run_worker(args.db, args.model, args.rpm, args.concurrency, args.worker, args.lease, args.mode))
+        print(f"本进程完成片段数: {done_count}")
+    elif args.command == "status":
+        conn = connect(args.db)
+        print(queue_status(conn))
+        conn.close()
+    elif args.command == "export":
+        output = export_results(args.db, args.json_out)
+        print(f"已完成 {sum(1 for p in output if p is not None)}/{len(output)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
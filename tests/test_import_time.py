@@ -0,0 +1,18 @@
+"""
+导入src.proofreader的启动用时不超过预算，且不在导入时加载各家SDK（见benchmarks/bench_import.py）
+
+在项目根目录运行：python -m pytest tests
+"""
+from benchmarks.bench_import import measure_import, DEFAULT_BUDGET_MS, LAZY_MODULES
+
+
+def test_import_within_budget():
+    # 取多次中的最小值，减少磁盘缓存等的干扰
+    elapsed_ms = min(measure_import()[0] for _ in range(5))
+    assert elapsed_ms <= DEFAULT_BUDGET_MS, f"import src.proofreader 用时 {elapsed_ms:.1f}ms，超出预算 {DEFAULT_BUDGET_MS}ms"
+
+
+def test_sdks_imported_lazily():
+    _, imported = measure_import()
+    eager = sorted({name for name in imported if name.split(".")[0] in LAZY_MODULES})
+    assert not eager, f"不应在导入时加载: {', '.join(eager)}"